@@ -33,6 +33,7 @@ export interface BackendStackProps extends core.StackProps {
   readonly pipelineName: string
   readonly modelTrainingsPipelineExecIndexName: string
   readonly modelEndpointArnIndexName: string
+  readonly processingStepFingerprintIndexName: string
   readonly modelEndpointCleanupSchedule: string
   readonly modelEndpointExpiryTimeInMins: number
 }
@@ -53,6 +54,7 @@ export class BackendStack extends core.Stack {
           modelTrainingExecution,
           modelEndpointMaintenance,
           featureImportance,
+          processingProfile,
           modelPrediction,
           assetsBucket,
           modelsBucket,
@@ -64,6 +66,7 @@ export class BackendStack extends core.Stack {
       assetsBucketCsvKeyPrefix,
       modelTrainingsPipelineExecIndexName,
       modelEndpointArnIndexName,
+      processingStepFingerprintIndexName,
       modelEndpointExpiryTimeInMins,
       modelEndpointCleanupSchedule,
     } = props
@@ -85,10 +88,12 @@ export class BackendStack extends core.Stack {
       modelTrainingExecution,
       modelEndpointMaintenance,
       featureImportance,
+      processingProfile,
       trainingTemplate,
       executorCodePath,
       modelTrainingsPipelineExecIndexName: namespaced(this, modelTrainingsPipelineExecIndexName),
       modelEndpointArnIndexName: namespaced(this, modelEndpointArnIndexName),
+      processingStepFingerprintIndexName: namespaced(this, processingStepFingerprintIndexName),
       modelEndpointExpiryTimeInMins,
       modelEndpointCleanupSchedule,
     })
@@ -29,6 +29,7 @@ export interface PersistentBackendStackProps extends core.StackProps {
   readonly administratorName: string
   readonly modelTrainingsPipelineExecIndexName: string
   readonly modelEndpointArnIndexName: string
+  readonly processingStepFingerprintIndexName: string
 }
 
 /**
@@ -50,6 +51,7 @@ export class PersistentBackendStack extends core.Stack {
       administratorName,
       modelTrainingsPipelineExecIndexName,
       modelEndpointArnIndexName,
+      processingStepFingerprintIndexName,
     } = props
 
     setNamespace(this, namespace)
@@ -57,6 +59,7 @@ export class PersistentBackendStack extends core.Stack {
     const dataStorage = new DataStorage(this, 'DataStorage', {
       modelTrainingsPipelineExecIndexName: namespaced(this, modelTrainingsPipelineExecIndexName),
       modelEndpointArnIndexName: namespaced(this, modelEndpointArnIndexName),
+      processingStepFingerprintIndexName: namespaced(this, processingStepFingerprintIndexName),
     })
 
     const identityStack = new IdentityStack(this, 'Identity', {
@@ -37,6 +37,7 @@ interface FEMetadata {
     assets: string[]
     enabled: boolean
     trainSetSize: number // 0.80
+    refitEvery?: number // 0 = fit once
   }
   fftSettings: {
     assetClasses: string[]
@@ -53,6 +54,19 @@ interface FEMetadata {
     fitBatchSize: number
     fitShuffle: boolean
   }
+  crossAssetSettings?: {
+    enabled: boolean
+    window: number
+    assets?: string | string[]
+    againstPredicted?: boolean
+    againstAssetClass?: boolean
+  }
+  pruningSettings?: {
+    enabled: boolean
+    topK?: number
+    cumulativeImportance?: number // 0.95
+    correlationThreshold?: number // 0.95
+  }
 }
 
 const EMPTY_FEMetadata: FEMetadata = {
@@ -147,6 +161,18 @@ export interface TrainingTemplateData {
   updatedAt: number
   feMeta: FEMetadata
   deepARMeta: DeepARTemplateData
+  // set by the feature engineering step, sizes the processing instance of the next executions
+  processingPlan?: {
+    instanceType: string
+    volumeSizeInGB: number
+    estimate: string
+    coefficients: string
+    // `updatedAt` of the template the plan was made for, the plan is ignored once the template is saved again
+    templateUpdatedAt: number
+    // larger instance type used after the step was killed (out of memory)
+    failoverInstanceType?: string
+    updatedAt: number
+  }
 }
 
 export const EMPTY_TrainingTemplateData: TrainingTemplateData = {
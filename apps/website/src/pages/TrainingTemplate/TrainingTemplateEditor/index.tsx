@@ -524,7 +524,12 @@ export const TrainingTemplateEditor: FunctionComponent = () => {
                 controlId='field_deepar_freq'
                 value={trainingTemplateData.deepARMeta.freq}
                 required={true}
-                disabled={true}
+                placeholder='1D, W or M'
+                onChange={(e) => {
+                  updateTrainingTemplateData((draft: Draft<TrainingTemplateData>) => {
+                    draft.deepARMeta.freq = e
+                  })
+                }}
               />
             </FormField>
             <FormField
@@ -102,12 +102,24 @@ const handler = async (event) => {
 
     const deepARMeta = template.deepARMeta
 
+    // instance type and volume size planned by the previous feature engineering runs of the template,
+    // a plan made for an earlier version of the template is ignored (the template is saved with a new updatedAt)
+    const processingPlan = template.processingPlan
+    const processingParameters = []
+    if (processingPlan != null && (processingPlan.templateUpdatedAt || 0) === (template.updatedAt || 0)) {
+      processingParameters.push(
+        { Name: 'ProcessingInstanceType', Value: `${processingPlan.instanceType}` },
+        { Name: 'ProcessingVolumeSizeInGB', Value: `${processingPlan.volumeSizeInGB}` },
+      )
+    }
+
     const pipelineExecutionResult = await sagemaker
       .startPipelineExecution({
         PipelineName: PIPELINE_NAME,
         PipelineParameters: [
           { Name: 'ExecutionId', Value: executionId },
           { Name: 'AssetsData', Value: `s3://${ASSET_BUCKET_NAME}/${ASSET_BUCKET_KEYPREFIX}` },
+          { Name: 'HyperParamTimeFreq', Value: `${deepARMeta.freq}` },
           { Name: 'HyperParamEpochs', Value: `${deepARMeta.hyperParams.epochs}` },
           { Name: 'HyperParamEarlyStoppingPatience', Value: `${deepARMeta.hyperParams.early_stopping_patience}` },
           { Name: 'HyperParamMiniBatchSize', Value: `${deepARMeta.hyperParams.mini_batch_size}` },
@@ -115,6 +127,7 @@ const handler = async (event) => {
           { Name: 'HyperParamContextLength', Value: `${deepARMeta.contextLength}` },
           { Name: 'HyperParamPredictionLength', Value: `${deepARMeta.predictionLength}` },
           { Name: 'ModelPackageGroupName', Value: `asset-prediction-${Math.floor(new Date().getTime() / 1000.0)}` },
+          ...processingParameters,
         ],
       })
       .promise()
@@ -23,6 +23,7 @@ import { namespaced, namespacedBucket } from '@infra/common'
 export interface DataStorageProps extends core.NestedStackProps {
   readonly modelTrainingsPipelineExecIndexName: string
   readonly modelEndpointArnIndexName: string
+  readonly processingStepFingerprintIndexName: string
 }
 
 export class DataStorage extends core.NestedStack {
@@ -38,6 +39,8 @@ export class DataStorage extends core.NestedStack {
 
   public readonly featureImportance: ddb.ITable
 
+  public readonly processingProfile: ddb.ITable
+
   public readonly assetsBucket: s3.IBucket
 
   public readonly modelsBucket: s3.IBucket
@@ -47,7 +50,7 @@ export class DataStorage extends core.NestedStack {
   constructor(scope: Construct, id: string, props: DataStorageProps) {
     super(scope, id, props)
 
-    const { modelTrainingsPipelineExecIndexName, modelEndpointArnIndexName } = props
+    const { modelTrainingsPipelineExecIndexName, modelEndpointArnIndexName, processingStepFingerprintIndexName } = props
 
     this.assetsMetadata = new ddb.Table(this, 'AssetsMetadataTable', {
       tableName: namespaced(this, 'asset-metadata'),
@@ -91,6 +94,15 @@ export class DataStorage extends core.NestedStack {
       },
     })
 
+    // to find a finished execution with the same feature engineering inputs (only set on finished executions)
+    modelTrainingExecution.addGlobalSecondaryIndex({
+      indexName: processingStepFingerprintIndexName,
+      partitionKey: {
+        name: 'processingStepFingerprint',
+        type: ddb.AttributeType.STRING,
+      },
+    })
+
     this.modelTrainingExecution = modelTrainingExecution
 
     const modelEndpointMaintenance = new ddb.Table(this, 'ModelEndpointMaintenance', {
@@ -136,6 +148,22 @@ export class DataStorage extends core.NestedStack {
       encryption: ddb.TableEncryption.AWS_MANAGED,
     })
 
+    // measured profiles of the feature engineering runs, the resource planner queries the latest ones
+    this.processingProfile = new ddb.Table(this, 'ProcessingProfile', {
+      tableName: namespaced(this, 'processing-profile'),
+      removalPolicy: props.removalPolicy,
+      partitionKey: {
+        name: 'profileVersion',
+        type: ddb.AttributeType.NUMBER,
+      },
+      sortKey: {
+        name: 'createdAt',
+        type: ddb.AttributeType.NUMBER,
+      },
+      billingMode: ddb.BillingMode.PAY_PER_REQUEST,
+      encryption: ddb.TableEncryption.AWS_MANAGED,
+    })
+
     this.assetsBucket = new s3.Bucket(this, 'AssetsBucket', {
       bucketName: namespacedBucket(this, 'assets'),
       encryption: s3.BucketEncryption.S3_MANAGED,
@@ -20,9 +20,42 @@ const aws = require('aws-sdk')
 
 const MODEL_TRAINING_EXECUTION_TABLE = process.env.MODEL_TRAINING_EXECUTION_TABLE
 const MODEL_TRAININGS_INDEX = process.env.MODEL_TRAININGS_INDEX
+const TRAINING_TEMPLATE_TABLE = process.env.TRAINING_TEMPLATE_TABLE
+
+// name of the feature engineering step in pipeline-definition/pipeline-template/pipeline.json
+const FEATURE_ENGINEERING_STEP_NAME = 'Feature-Engineering-Step'
 
 const ddb = new aws.DynamoDB.DocumentClient()
 
+// :: the next executions of the template start the feature engineering step on the failover instance type
+// of its processing plan (a larger one, stored by the step before its heavy stages)
+const switchToFailoverInstanceType = async (templateId) => {
+  try {
+    await ddb
+      .update({
+        TableName: TRAINING_TEMPLATE_TABLE,
+        Key: {
+          Id: templateId,
+        },
+        UpdateExpression: 'SET #plan.#instanceType = #plan.#failover REMOVE #plan.#failover',
+        ConditionExpression: 'attribute_exists(#plan.#failover)',
+        ExpressionAttributeNames: {
+          '#plan': 'processingPlan',
+          '#instanceType': 'instanceType',
+          '#failover': 'failoverInstanceType',
+        },
+      })
+      .promise()
+
+    console.log(`Processing plan of template ${templateId} switched to its failover instance type`)
+  } catch (err) {
+    if (err.code !== 'ConditionalCheckFailedException') {
+      throw err
+    }
+    console.log(`Processing plan of template ${templateId} has no failover instance type`)
+  }
+}
+
 const handler = async (event) => {
   console.log(`:: pipeline step status change handler :: ${JSON.stringify(event)}`)
 
@@ -87,6 +120,16 @@ const handler = async (event) => {
         },
       })
       .promise()
+
+    // the feature engineering step failed without setting its own status to FAILED: the container was killed,
+    // most likely for running out of memory
+    if (
+      event.detail.stepName === FEATURE_ENGINEERING_STEP_NAME &&
+      currentStepStatus === 'Failed' &&
+      modelTrainingExecution.processingStepStatus === 'RUNNING'
+    ) {
+      await switchToFailoverInstanceType(modelTrainingExecution.templateId)
+    }
   } catch (err) {
     console.error(`Error retreiving/updating training instance from DDB :: ${JSON.stringify(err)}`, err)
   }
@@ -23,10 +23,12 @@ import { namespaced, common_lambda as dlambda, common_iam as ciam } from '@infra
 interface Environment extends dlambda.DeclaredLambdaEnvironment {
   readonly MODEL_TRAINING_EXECUTION_TABLE: string
   readonly MODEL_TRAININGS_INDEX: string
+  readonly TRAINING_TEMPLATE_TABLE: string
 }
 
 interface Dependencies extends dlambda.DeclaredLambdaDependencies {
   readonly modelTrainingExecution: ddb.ITable
+  readonly trainingTemplate: ddb.ITable
   readonly modelTrainingsPipelineExecIndexName: string
 }
 
@@ -34,7 +36,7 @@ type TDeclaredProps = dlambda.DeclaredLambdaProps<Environment, Dependencies>
 
 export class PipelineStepStatusChangeHandlerLambda extends dlambda.DeclaredLambdaFunction<Environment, Dependencies> {
   constructor(scope: Construct, id: string, props: dlambda.ExposedDeclaredLambdaProps<Dependencies>) {
-    const { modelTrainingExecution, modelTrainingsPipelineExecIndexName } = props.dependencies
+    const { modelTrainingExecution, trainingTemplate, modelTrainingsPipelineExecIndexName } = props.dependencies
 
     const declaredProps: TDeclaredProps = {
       functionName: namespaced(scope, 'PipelineStepStatusChangeHandler'),
@@ -48,6 +50,7 @@ export class PipelineStepStatusChangeHandlerLambda extends dlambda.DeclaredLambd
       environment: {
         MODEL_TRAINING_EXECUTION_TABLE: modelTrainingExecution.tableName,
         MODEL_TRAININGS_INDEX: modelTrainingsPipelineExecIndexName,
+        TRAINING_TEMPLATE_TABLE: trainingTemplate.tableName,
       },
       initialPolicy: [
         ciam.PolicyStatements.ddb.readDDBTable(modelTrainingExecution.tableArn),
@@ -55,6 +58,7 @@ export class PipelineStepStatusChangeHandlerLambda extends dlambda.DeclaredLambd
           `${modelTrainingExecution.tableArn}/index/${modelTrainingsPipelineExecIndexName}`,
         ),
         ciam.PolicyStatements.ddb.updateDDBTable(modelTrainingExecution.tableArn),
+        ciam.PolicyStatements.ddb.updateDDBTable(trainingTemplate.tableArn),
       ],
     }
 
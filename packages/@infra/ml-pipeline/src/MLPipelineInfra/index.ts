@@ -50,9 +50,11 @@ export interface MlPipelineProps {
   readonly modelTrainingExecution: ddb.ITable
   readonly modelEndpointMaintenance: ddb.ITable
   readonly featureImportance: ddb.ITable
+  readonly processingProfile: ddb.ITable
   readonly executorCodePath: string
   readonly modelTrainingsPipelineExecIndexName: string
   readonly modelEndpointArnIndexName: string
+  readonly processingStepFingerprintIndexName: string
   readonly modelEndpointExpiryTimeInMins: number
   readonly modelEndpointCleanupSchedule: string
   readonly assetsBucketCsvKeyPrefix: string
@@ -77,9 +79,11 @@ export class MlPipeline extends Construct {
       modelTrainingExecution,
       modelEndpointMaintenance,
       featureImportance,
+      processingProfile,
       executorCodePath,
       modelTrainingsPipelineExecIndexName,
       modelEndpointArnIndexName,
+      processingStepFingerprintIndexName,
       modelEndpointExpiryTimeInMins,
       modelEndpointCleanupSchedule,
       assetsBucketCsvKeyPrefix,
@@ -105,8 +109,14 @@ export class MlPipeline extends Construct {
             common_iam.PolicyStatements.ddb.readDDBTable(assetsMetadata.tableArn),
             common_iam.PolicyStatements.ddb.readDDBTable(trainingTemplate.tableArn),
             common_iam.PolicyStatements.ddb.readDDBTable(modelTrainingExecution.tableArn),
+            common_iam.PolicyStatements.ddb.readDDBTable(
+              `${modelTrainingExecution.tableArn}/index/${processingStepFingerprintIndexName}`,
+            ),
             common_iam.PolicyStatements.ddb.updateDDBTable(modelTrainingExecution.tableArn),
+            common_iam.PolicyStatements.ddb.updateDDBTable(trainingTemplate.tableArn),
             common_iam.PolicyStatements.ddb.updateDDBTable(featureImportance.tableArn),
+            common_iam.PolicyStatements.ddb.readDDBTable(processingProfile.tableArn),
+            common_iam.PolicyStatements.ddb.updateDDBTable(processingProfile.tableArn),
           ],
         }),
       },
@@ -136,6 +146,7 @@ export class MlPipeline extends Construct {
       processingInstanceTypeDefault: 'ml.m5.xlarge',
       modelTrainingInstanceTypeDefault: 'ml.m5.xlarge',
       processingInstanceCountDefault: 1,
+      processingVolumeSizeInGBDefault: 30,
       processingStepDockerImageUri: processingStepDockerRepo.repositoryUri,
       pipelineExecutionRoleArn: this.pipelineExecutionRole.roleArn,
       modelsBucketName: modelsBucket.bucketName,
@@ -147,6 +158,8 @@ export class MlPipeline extends Construct {
       trainingTemplateTableName: trainingTemplate.tableName,
       modelTrainingsTableName: modelTrainingExecution.tableName,
       featureImportanceTableName: featureImportance.tableName,
+      processingProfileTableName: processingProfile.tableName,
+      processingStepFingerprintIndexName,
     }
 
     const createPipelineJsonFilled = createPipelineJsonTemplate(pipelineConfig)
@@ -241,6 +254,7 @@ export class MlPipeline extends Construct {
     const pipelineStepStatusChangeHandler = new PipelineStepStatusChangeHandlerLambda(this, 'StepStatChangeHandler', {
       dependencies: {
         modelTrainingExecution,
+        trainingTemplate,
         modelTrainingsPipelineExecIndexName,
       },
     })
@@ -0,0 +1,90 @@
+# # WALK-FORWARD ARIMA CHECK
+#
+# Compares the one-step-ahead forecasts of `walk_forward_forecast` of lib/arima.py with a brute-force walk
+# forward on small random series: for every out-of-sample point t a new ARIMA model of X[:t] is filtered with
+# the current parameters and forecasts X[t]; the parameters are fitted on the training points, and with
+# refit_every > 0 fitted again (from scratch) on X[:t] every `refit_every` points.
+# The max abs difference of the out-of-sample forecasts, relative to the standard deviation of the series,
+# must stay below --tolerance for refit_every=0 (same parameters on both sides) and below --refit-tolerance for
+# every --refit-every (walk_forward_forecast warm-starts the refits, so the optimizer stops at slightly different
+# parameters than the fits from scratch); the wall times of both are printed.
+#
+# usage (from the docker dir): python benchmarks/arima.py [--series 3] [--length 150] [--refit-every 1 10] [--tolerance 1e-8] [--refit-tolerance 1e-2]
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.arima as arima
+
+ORDER = (5, 1, 0)
+TRAIN_SET_SIZE = 0.7
+
+
+# :: random walk with autocorrelated steps, as daily prices
+def random_series(rng, length):
+    steps = rng.standard_normal(length)
+    for t in range(1, length):
+        steps[t] += 0.4 * steps[t - 1]
+    return 100.0 + np.cumsum(steps)
+
+def brute_force_forecast(X, train_size, order, refit_every):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    params = ARIMA(X[:train_size], order=order).fit().params
+    forecasts = np.full(len(X), np.nan)
+    for t in range(train_size, len(X)):
+        if refit_every > 0 and t > train_size and (t - train_size) % refit_every == 0:
+            params = ARIMA(X[:t], order=order).fit().params
+        forecasts[t] = ARIMA(X[:t], order=order).filter(params).forecast(1)[0]
+    return forecasts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=3)
+    parser.add_argument("--length", type=int, default=150, help="points per series")
+    parser.add_argument("--refit-every", type=int, nargs="+", default=[1, 10], help="refit intervals checked besides 0")
+    parser.add_argument("--tolerance", type=float, default=1e-8, help="max abs difference relative to the std of the series, refit_every=0")
+    parser.add_argument("--refit-tolerance", type=float, default=1e-2, help="max abs difference relative to the std of the series, refit_every > 0")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # statsmodels warns about non-stationary/non-invertible starting parameters and convergence on short series
+    warnings.simplefilter('ignore')
+
+    rng = np.random.default_rng(args.seed)
+    series = [random_series(rng, args.length) for _ in range(args.series)]
+    train_size = int(args.length * TRAIN_SET_SIZE)
+    errors = []
+
+    # import statsmodels before the timings
+    arima.walk_forward_forecast(series[0][:train_size], train_size, order=ORDER)
+
+    for refit_every in [0] + args.refit_every:
+        max_diff, diffs, walk_forward_time, brute_force_time = 0.0, [], 0.0, 0.0
+        for X in series:
+            started = time.time()
+            forecasts = arima.walk_forward_forecast(X, train_size, order=ORDER, refit_every=refit_every)
+            walk_forward_time += time.time() - started
+
+            started = time.time()
+            expected = brute_force_forecast(X, train_size, ORDER, refit_every)
+            brute_force_time += time.time() - started
+
+            diff = np.abs(forecasts[train_size:] - expected[train_size:]) / float(np.std(X))
+            max_diff = max(max_diff, float(np.max(diff)))
+            diffs.append(diff)
+
+        tolerance = args.tolerance if refit_every == 0 else args.refit_tolerance
+        print(f"refit_every={refit_every:<3} relative difference max {max_diff:.2e} / mean {float(np.mean(np.concatenate(diffs))):.2e} (tolerance {tolerance:.0e}), "
+              f"walk forward {walk_forward_time:.2f}s, brute force {brute_force_time:.2f}s")
+        if not max_diff <= tolerance:
+            errors.append(f"refit_every={refit_every}")
+
+    if errors:
+        sys.exit("walk_forward_forecast differs from the brute-force walk forward: " + ", ".join(errors))
@@ -0,0 +1,150 @@
+# # AWS CLIENTS CONCURRENCY CHECK
+#
+# Runs parallel S3 uploads and DynamoDB writes through S3Client/DDBClient against a local moto server (a real
+# HTTP endpoint, so the requests go through the urllib3 connection pools; not part of the processing image:
+# pip install "moto[server]"), with a connection pool (FE_AWS_MAX_POOL_CONNECTIONS, 4 by default here) smaller
+# than the number of threads and than the transfer concurrency, and checks that:
+# - every upload and write arrived
+# - every thread got its own boto3 resources and reused them across its clients
+# - the multipart uploads of S3Client (`transfer_config`) logged no urllib3 "connection pool is full" warnings
+# - the same multipart uploads with the transfer concurrency not capped to the pool did log them, i.e. the
+#   check above can fail
+#
+# usage (from the docker dir): python benchmarks/aws_clients.py [--threads 32] [--jobs 400] [--multipart 2] [--parts 8]
+
+import argparse
+import io
+import logging
+import os
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('S3_ASSETS_BUCKET', 'assets')
+os.environ.setdefault('S3_MODELS_BUCKET', 'models')
+os.environ.setdefault('DDB_ASSETS_TABLE', 'assets')
+os.environ.setdefault('DDB_TEMPLATES_TABLE', 'templates')
+os.environ.setdefault('DDB_EXECUTIONS_TABLE', 'executions')
+os.environ.setdefault('DDB_FEATURE_IMPORTANCE_TABLE', 'feature-importance')
+os.environ.setdefault('FE_AWS_MAX_POOL_CONNECTIONS', '4')
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from moto.server import ThreadedMotoServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.aws as aws
+import lib.config as config
+from lib.ddb import DDBClient
+from lib.s3 import S3Client
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def create_stand_ins():
+    s3 = boto3.resource('s3')
+    s3.create_bucket(Bucket=config.assetsBucketName)
+    s3.create_bucket(Bucket=config.modelsBucketName)
+    boto3.resource('dynamodb').create_table(
+        TableName=config.executionsTableName,
+        KeySchema=[{ 'AttributeName': 'Id', 'KeyType': 'HASH' }],
+        AttributeDefinitions=[{ 'AttributeName': 'Id', 'AttributeType': 'S' }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+def write_blob(path, size):
+    with open(path, 'wb') as fp:
+        fp.write(os.urandom(size))
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--jobs", type=int, default=400, help="uploads and writes, one of each per job")
+    parser.add_argument("--size", type=int, default=1 << 16, help="bytes per upload")
+    parser.add_argument("--multipart", type=int, default=2, help="multipart uploads of --parts parts, each run")
+    parser.add_argument("--parts", type=int, default=8)
+    args = parser.parse_args()
+
+    warnings = io.StringIO()
+    handler = logging.StreamHandler(warnings)
+    logging.getLogger('urllib3').addHandler(handler)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    pool_full = lambda: warnings.getvalue().count('Connection pool is full')
+    # the request log of the moto server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    resources = {}
+    lock = threading.Lock()
+
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    os.environ['AWS_ENDPOINT_URL'] = f"http://127.0.0.1:{port}"
+    try:
+        create_stand_ins()
+        small_file = write_blob('/tmp/aws_clients_blob', args.size)
+        # parts of the minimum multipart size, the transfer runs up to `max_concurrency` of them at once
+        part_size = TransferConfig().multipart_chunksize
+        large_file = write_blob('/tmp/aws_clients_multipart', args.parts * part_size)
+
+        # :: small uploads and writes from many threads
+        def job(i):
+            S3Client().uploadToModels(f"exec-{i % 8}", f"check/{i}", small_file)
+            DDBClient().updateExecItemStatus(f"exec-{i}", 'RUNNING', [], stage='check')
+            with lock:
+                resources.setdefault(threading.get_ident(), set()).update({ id(aws.resource('s3')), id(aws.resource('dynamodb')) })
+
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(job, range(args.jobs)))
+
+        objects = sum(1 for _ in boto3.resource('s3').Bucket(config.modelsBucketName).objects.filter(Prefix='execution/'))
+        items = len(boto3.resource('dynamodb').Table(config.executionsTableName).scan()['Items'])
+        small_pool_full = pool_full()
+
+        # :: multipart uploads of S3Client, the transfer concurrency is capped to the pool
+        for i in range(args.multipart):
+            S3Client().uploadToModels('exec-multipart', f"check/{i}", large_file)
+        capped_pool_full = pool_full() - small_pool_full
+
+        # :: the same uploads with the transfer concurrency above the pool, on a new thread (new resources)
+        def uncapped_uploads():
+            bucket = aws.resource('s3').Bucket(config.modelsBucketName)
+            for i in range(args.multipart):
+                bucket.upload_file(large_file, f"execution/exec-uncapped/check/{i}", Config=TransferConfig(max_concurrency=config.awsMaxTransferConcurrency))
+
+        thread = threading.Thread(target=uncapped_uploads)
+        thread.start()
+        thread.join()
+        uncapped_pool_full = pool_full() - small_pool_full - capped_pool_full
+    finally:
+        server.stop()
+
+    per_thread = { len(ids) for ids in resources.values() }
+    all_ids = set().union(*resources.values())
+
+    print(f"{args.jobs} uploads and writes on {args.threads} threads (max_pool_connections={config.awsMaxPoolConnections})")
+    print(f"objects: {objects}, items: {items}, pool-full warnings: {small_pool_full}")
+    print(f"threads: {len(resources)}, resources per thread: {sorted(per_thread)}, distinct resources: {len(all_ids)}")
+    print(f"{args.multipart} multipart uploads of {args.parts} parts: pool-full warnings with S3Client's transfer config "
+          f"(max_concurrency={aws.transfer_config().max_concurrency}): {capped_pool_full}, "
+          f"with max_concurrency={config.awsMaxTransferConcurrency}: {uncapped_pool_full}")
+
+    errors = []
+    if objects != args.jobs or items != args.jobs:
+        errors.append("missing uploads or writes")
+    if small_pool_full > 0 or capped_pool_full > 0:
+        errors.append("connection pool is full")
+    if per_thread != { 2 } or len(all_ids) != 2 * len(resources):
+        errors.append("boto3 resources are shared between threads")
+    if config.awsMaxTransferConcurrency > config.awsMaxPoolConnections and uncapped_pool_full == 0:
+        errors.append("no pool-full warnings without the cap, the check can't detect them")
+    if errors:
+        sys.exit(", ".join(errors))
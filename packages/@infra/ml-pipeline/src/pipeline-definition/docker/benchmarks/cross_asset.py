@@ -0,0 +1,90 @@
+# # CROSS-ASSET BENCHMARK
+#
+# Checks the rolling correlation and beta of lib/cross_asset.py (rolling moment sums over the whole
+# days x assets matrix) against pandas rolling().corr() / rolling().cov() / rolling().var() on random
+# daily returns, and prints the wall times of both.
+# The max abs difference is computed on the rows where pandas returns a value (from window-1 on);
+# it must stay below --tolerance. A series shorter than the window must give all-NaN outputs, as pandas.
+#
+# usage (from the docker dir): python benchmarks/cross_asset.py [--days 2500] [--assets 500] [--window 20] [--repeat 3]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.cross_asset as cross_asset
+
+
+# :: random prices with a common factor, so the assets are correlated with the target
+def random_prices(days, assets, seed=0):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0, 0.01, (days, 1))
+    returns = market * rng.uniform(0.2, 1.5, (1, assets + 1)) + rng.normal(0.0, 0.01, (days, assets + 1))
+    prices = 100.0 * np.cumprod(1.0 + returns, axis=0)
+    return prices[:, :assets], prices[:, assets]
+
+def run_numpy(returns, target_returns, window):
+    return cross_asset.rolling_corr_beta(returns, target_returns, window)
+
+def run_pandas(returns, target_returns, window):
+    X = pd.DataFrame(returns)
+    y = pd.Series(target_returns)
+    corr = X.rolling(window).corr(y)
+    beta = X.rolling(window).cov(y).div(y.rolling(window).var(), axis='index')
+    return corr.to_numpy(), beta.to_numpy()
+
+def max_abs_diff(a, b, window):
+    a, b = a[window - 1:], b[window - 1:]
+    valid = np.isfinite(a) & np.isfinite(b)
+    return float(np.max(np.abs(a[valid] - b[valid]))) if valid.any() else 0.0
+
+def timed(fn, repeat, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.time()
+        result = fn(*args)
+        best = min(best, time.time() - started)
+    return best, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=2500, help="trading days of the price matrix")
+    parser.add_argument("--assets", type=int, default=500, help="assets of the price matrix")
+    parser.add_argument("--window", type=int, default=20, help="rolling window")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=1e-8)
+    args = parser.parse_args()
+
+    prices, target = random_prices(args.days, args.assets)
+    returns = cross_asset.daily_returns(prices)
+    target_returns = cross_asset.daily_returns(target)
+
+    numpy_time, (corr, beta) = timed(run_numpy, args.repeat, returns, target_returns, args.window)
+    pandas_time, (pandas_corr, pandas_beta) = timed(run_pandas, args.repeat, returns, target_returns, args.window)
+
+    corr_diff = max_abs_diff(corr, pandas_corr, args.window)
+    beta_diff = max_abs_diff(beta, pandas_beta, args.window)
+
+    print(f"{args.days} days x {args.assets} assets, window {args.window}")
+    print(f"max abs difference to pandas: corr {corr_diff:.2e}, beta {beta_diff:.2e}")
+    print(f"pandas rolling:      {pandas_time:.3f}s")
+    print(f"rolling moment sums: {numpy_time:.3f}s ({pandas_time / numpy_time:.1f}x)")
+
+    # :: series shorter than the window (e.g. weekly or monthly resampled histories)
+    short_days = max(2, args.window // 2)
+    short_prices, short_target = random_prices(short_days, args.assets)
+    short_returns, short_target_returns = cross_asset.daily_returns(short_prices), cross_asset.daily_returns(short_target)
+    short_corr, short_beta = run_numpy(short_returns, short_target_returns, args.window)
+    pandas_short_corr, pandas_short_beta = run_pandas(short_returns, short_target_returns, args.window)
+    short_all_nan = all(np.isnan(a).all() for a in [short_corr, short_beta, pandas_short_corr, pandas_short_beta])
+    print(f"{short_days} days (shorter than the window): all NaN as pandas: {short_all_nan}")
+
+    if corr_diff > args.tolerance or beta_diff > args.tolerance:
+        sys.exit(f"rolling_corr_beta differs from pandas by more than {args.tolerance}")
+    if not short_all_nan:
+        sys.exit("rolling_corr_beta of a series shorter than the window isn't all NaN")
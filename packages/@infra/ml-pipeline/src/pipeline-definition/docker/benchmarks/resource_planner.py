@@ -0,0 +1,123 @@
+# # RESOURCE PLANNER CALIBRATION CHECK
+#
+# Builds synthetic run profiles of random templates and universe sizes from known coefficients
+# (stage runtimes and peak memory, with multiplicative noise), runs `calibrate` of lib/resource_planner.py
+# on them and checks that:
+# - without noise, every stage and memory coefficient is recovered exactly
+# - with --noise, every stage coefficient is recovered within --tolerance and the calibrated memory model
+#   predicts the peak memory within --tolerance (the per-cell term is only a few % of the peak of these
+#   profiles, so the noise moves it much more than the prediction)
+# - on runs of a single template (cells and exported values grow together) the memory fit falls back to
+#   base + scale x default per-value terms, which must still predict the peak memory
+# - with fewer than `min_samples` profiles the defaults are kept
+#
+# usage (from the docker dir): python benchmarks/resource_planner.py [--profiles 40] [--noise 0.02] [--tolerance 0.05]
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.resource_planner as resource_planner
+
+ASSET_CLASSES = ['Equity', 'FX', 'Commodity', 'Crypto']
+
+TRUE_STAGE_COEFFICIENTS = { stage: 3.0 * value for stage, value in resource_planner.DEFAULT_STAGE_COEFFICIENTS.items() }
+TRUE_MEMORY_COEFFICIENTS = { 'base': 2.0 * resource_planner.GiB, 'perCell': 30.0, 'perExportValue': 90.0 }
+
+
+def random_assets(rng, num_assets):
+    return [{ 'ticker': f"A{i}", 'assetClass': ASSET_CLASSES[int(rng.integers(len(ASSET_CLASSES)))] } for i in range(num_assets)]
+
+def random_template(rng, assets):
+    tickers = [a['ticker'] for a in assets]
+    pick = lambda n: list(rng.choice(tickers, size=min(n, len(tickers)), replace=False))
+    return {
+        'predictedAsset': tickers[0],
+        'feMeta': {
+            'baseAssets': 'all',
+            'taSettings': { 'enabled': bool(rng.random() < 0.8), 'assets': pick(int(rng.integers(1, 40))) },
+            'arimaSettings': { 'enabled': bool(rng.random() < 0.8), 'assets': pick(int(rng.integers(1, 10))), 'trainSetSize': 0.8, 'refitEvery': int(rng.choice([0, 20, 60])) },
+            'fftSettings': { 'enabled': bool(rng.random() < 0.8), 'assetClasses': list(rng.choice(ASSET_CLASSES, size=2, replace=False)), 'num_steps': [3, 6, 9][:int(rng.integers(1, 4))] },
+            'crossAssetSettings': { 'enabled': bool(rng.random() < 0.6), 'window': 20 },
+            'pruningSettings': { 'enabled': bool(rng.random() < 0.5), 'topK': int(rng.integers(20, 200)) },
+            'autoEncoderSettings': { 'enabled': bool(rng.random() < 0.8), 'fitEpoch': int(rng.integers(1, 5)) },
+        },
+        'deepARMeta': { 'predictionLength': int(rng.choice([7, 14, 30])), 'testWindows': int(rng.integers(1, 5)) },
+    }
+
+# :: profile of a run whose stages and peak memory follow the true coefficients up to the noise
+def synthetic_profile(rng, template, assets, num_rows, noise):
+    estimate = resource_planner.estimate(template, assets, num_rows)
+    jitter = lambda: 1.0 + noise * rng.standard_normal()
+    timings = { stage: estimate['units'][stage] * TRUE_STAGE_COEFFICIENTS[stage] * jitter() for stage in estimate['units'] if estimate['units'][stage] > 0 }
+    peak_memory = (TRUE_MEMORY_COEFFICIENTS['base'] + TRUE_MEMORY_COEFFICIENTS['perCell'] * estimate['cells'] + TRUE_MEMORY_COEFFICIENTS['perExportValue'] * estimate['exportValues']) * jitter()
+    return resource_planner.profile(estimate, timings, peak_memory)
+
+def predicted_memory(coefficients, p):
+    return coefficients['base'] + coefficients['perCell'] * p['cells'] + coefficients['perExportValue'] * p['exportValues']
+
+def relative_error(value, expected):
+    return abs(value - expected) / abs(expected)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=40)
+    parser.add_argument("--noise", type=float, default=0.02, help="relative noise of the synthetic timings and peak memory")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="max relative error of the recovered coefficients")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    errors = []
+
+    # :: mixed templates and universes, without and with noise
+    runs = []
+    for _ in range(args.profiles):
+        assets = random_assets(rng, int(rng.integers(20, 400)))
+        runs.append((random_template(rng, assets), assets, int(rng.integers(500, 5000))))
+
+    for noise, tolerance in [(0.0, 1e-6), (args.noise, args.tolerance)]:
+        profiles = [synthetic_profile(rng, template, assets, num_rows, noise) for template, assets, num_rows in runs]
+        calibrated = resource_planner.calibrate(profiles)
+        print(f"mixed templates ({calibrated['samples']} profiles, noise {noise:.0%}):")
+
+        for stage, expected in TRUE_STAGE_COEFFICIENTS.items():
+            value = calibrated['stages'].get(stage, float('nan'))
+            error = relative_error(value, expected)
+            print(f"  {stage:<22} {expected:.3e} -> {value:.3e} ({error:.2%})")
+            if not error <= tolerance:
+                errors.append(f"stage coefficient '{stage}' (noise {noise:.0%})")
+
+        for name, expected in TRUE_MEMORY_COEFFICIENTS.items():
+            value = calibrated['memory'].get(name, float('nan'))
+            error = relative_error(value, expected)
+            print(f"  memory {name:<15} {expected:.3e} -> {value:.3e} ({error:.2%})")
+            if noise == 0.0 and not error <= tolerance:
+                errors.append(f"memory coefficient '{name}'")
+
+        memory_error = max(relative_error(predicted_memory(calibrated['memory'], p), p['peakMemory']) for p in profiles) if calibrated['memory'] else float('inf')
+        print(f"  max peak memory error {memory_error:.2%}")
+        if not memory_error <= tolerance + 3 * noise:
+            errors.append(f"peak memory (noise {noise:.0%})")
+
+    # :: one template on growing histories, the per-cell and per-value terms can't be separated
+    assets = random_assets(rng, 200)
+    template = random_template(rng, assets)
+    profiles = [synthetic_profile(rng, template, assets, num_rows, args.noise) for num_rows in np.linspace(500, 5000, 8).astype(int)]
+    calibrated = resource_planner.calibrate(profiles)
+    memory_error = max(relative_error(predicted_memory(calibrated['memory'], p), p['peakMemory']) for p in profiles) if calibrated['memory'] else float('inf')
+    print(f"single template ({calibrated['samples']} profiles, noise {args.noise:.0%}): max peak memory error {memory_error:.2%}")
+    if not memory_error <= args.tolerance + 3 * args.noise:
+        errors.append("peak memory of the single template fit")
+
+    # :: too few profiles
+    calibrated = resource_planner.calibrate(profiles[:2])
+    print(f"2 profiles: {len(calibrated['stages'])} stage and {len(calibrated['memory'])} memory coefficients calibrated")
+    if calibrated['stages'] or calibrated['memory']:
+        errors.append("coefficients calibrated on fewer than min_samples profiles")
+
+    if errors:
+        sys.exit("not recovered: " + ", ".join(errors))
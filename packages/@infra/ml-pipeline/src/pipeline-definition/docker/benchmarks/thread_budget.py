@@ -0,0 +1,74 @@
+# # THREAD BUDGET BENCHMARK
+#
+# Runs the ARIMA process pool of the feature step (`pool_size` workers of the thread budget, started from a
+# fork server) on BLAS-heavy tasks, with the same number of workers in both runs:
+# - default: every worker keeps the BLAS threads its library picks (one per CPU it sees)
+# - budget: the workers split the budget (`worker_threads`), as add_arima_features does
+# and prints the wall times and the BLAS threads the workers ran with. The two runs only differ where the
+# libraries see more CPUs than the budget, i.e. in a container whose CPU quota is smaller than its host (e.g.
+# `docker run --cpus 4` on a larger host, or FE_THREAD_BUDGET below the CPUs of the machine).
+#
+# usage (from the docker dir): python benchmarks/thread_budget.py [--size 400] [--tasks 32] [--repeat 3]
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.threads as threads
+
+
+# :: BLAS-heavy task, returns the BLAS threads of the worker
+def blas_task(size):
+    import numpy as np
+    from threadpoolctl import threadpool_info
+    rng = np.random.default_rng(size)
+    a = rng.standard_normal((size, size))
+    for _ in range(5):
+        a = np.tanh(a @ a / size)
+    return max([info['num_threads'] for info in threadpool_info() if info['user_api'] == 'blas'] or [0])
+
+# :: wall time of the pool and the max BLAS threads of its workers, with the default or the budgeted threads
+def run(budgeted, args):
+    workers = threads.pool_size(0, args.tasks)
+    initializer, initargs = (threads.init_worker, (threads.worker_threads(workers),)) if budgeted else (None, ())
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'), initializer=initializer, initargs=initargs) as pool:
+        worker_threads = max(pool.map(blas_task, [args.size] * args.tasks))
+    return { 'time': time.time() - started, 'workerThreads': worker_threads }
+
+# :: best wall time of `repeat` runs of a mode, every run in a new process (the fork server keeps the settings of its first pool)
+def best_of(mode, args):
+    best = None
+    for _ in range(args.repeat):
+        command = [sys.executable, os.path.abspath(__file__), '--run', mode, '--size', str(args.size), '--tasks', str(args.tasks)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        best = result if best is None or result['time'] < best['time'] else best
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=400, help="matrix size of the BLAS tasks")
+    parser.add_argument("--tasks", type=int, default=32, help="BLAS tasks of the process pool")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--run", choices=['default', 'budget'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(args.run == 'budget', args)))
+        sys.exit(0)
+
+    workers = threads.pool_size(0, args.tasks)
+    print(f"CPUs: {os.cpu_count()}, cgroup quota: {threads.cgroup_cpu_quota()}, thread budget: {threads.budget()}, pool workers: {workers}")
+    defaults = best_of('default', args)
+    budgeted = best_of('budget', args)
+    print(f"default thread pools: {defaults['time']:.2f}s ({workers} workers x {defaults['workerThreads']} BLAS threads)")
+    print(f"thread budget:        {budgeted['time']:.2f}s ({workers} workers x {budgeted['workerThreads']} BLAS threads, {defaults['time'] / budgeted['time']:.2f}x)")
+    if defaults['workerThreads'] * workers <= threads.budget():
+        print("the libraries don't see more CPUs than the budget here, both runs use the same threads")
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+# :: one-step-ahead ARIMA forecasts for every point of the series
+# The model is fitted on the first `train_size` points; the out-of-sample points are then fed one
+# block at a time into the fitted state-space results with `extend` (filtering only, no refit), so
+# the forecast of X[t] only ever uses X[:t]. With `refit_every` > 0 the parameters are re-estimated
+# every `refit_every` observations (warm-started from the previous fit); 0 never refits.
+# In-sample points get the fitted one-step-ahead predictions.
+def walk_forward_forecast(X, train_size, order=(5,1,0), refit_every=0):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    X = np.asarray(X, dtype='float64')
+    n = len(X)
+    train_size = max(int(train_size), 1)
+
+    forecasts = np.empty(n)
+
+    model_fit = ARIMA(X[:train_size], order=order).fit()
+    forecasts[:train_size] = model_fit.fittedvalues
+
+    # the first predictions of a differenced model come from a diffuse state, keep the observations there
+    warmup = min(order[0] + order[1], train_size)
+    forecasts[:warmup] = X[:warmup]
+
+    pos = train_size
+    while pos < n:
+        end = min(pos + refit_every, n) if refit_every > 0 else n
+
+        if pos > train_size and refit_every > 0:
+            model_fit = ARIMA(X[:pos], order=order).fit(start_params=model_fit.params)
+
+        block_fit = model_fit.extend(X[pos:end])
+        forecasts[pos:end] = block_fit.predict(start=0, end=end - pos - 1)
+
+        pos = end
+
+    return forecasts
@@ -0,0 +1,41 @@
+import threading
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+from . import config
+
+# boto3 sessions and resources are not thread-safe (only the low-level clients are), so every thread
+# gets its own session and one resource per service, shared by every DDBClient/S3Client instance,
+# stage and batch execution of that thread; all of them use the client settings below
+_local = threading.local()
+
+
+def get_session():
+    if getattr(_local, 'session', None) is None:
+        _local.session = boto3.session.Session()
+        _local.resources = {}
+    return _local.session
+
+# :: connection pool, retry and timeout settings of every client
+def client_config():
+    return Config(
+        max_pool_connections=config.awsMaxPoolConnections,
+        retries={
+            'max_attempts': config.awsMaxAttempts,
+            'mode': config.awsRetryMode,
+        },
+        connect_timeout=config.awsConnectTimeout,
+        read_timeout=config.awsReadTimeout,
+    )
+
+# :: S3 transfers use threads as well, keep them within the connection pool
+def transfer_config():
+    return TransferConfig(max_concurrency=min(config.awsMaxTransferConcurrency, config.awsMaxPoolConnections))
+
+# :: resource of the calling thread
+def resource(service_name):
+    session = get_session()
+    if service_name not in _local.resources:
+        _local.resources[service_name] = session.resource(service_name, config=client_config())
+    return _local.resources[service_name]
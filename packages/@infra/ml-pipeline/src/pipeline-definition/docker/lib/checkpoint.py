@@ -0,0 +1,125 @@
+import hashlib
+import os
+import shutil
+import time
+import pandas as pd
+import simplejson as json
+
+from . import logger
+from . import config
+
+
+# :: stable fingerprint of any JSON-serialisable input (template settings, ticker lists, digests)
+def fingerprint(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# :: content hash of a local file, read in blocks
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.md5()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# :: persists the intermediate DataFrame after each feature engineering stage
+# stage fingerprints are chained, so changing an early stage invalidates all later checkpoints.
+# The DataFrames are only written when they can be used: with resume they are kept on the processing
+# volume until the execution finishes, with upload they are removed once they are in S3.
+class CheckpointStore:
+    def __init__(self, exec_id, s3_client, ddb_client, resume=False, upload=False, completed=None):
+        self.exec_id = exec_id
+        self.s3_client = s3_client
+        self.ddb_client = ddb_client
+        self.resume = resume
+        self.upload = upload
+        self.completed = dict(completed or {}) if resume else {}
+        self.last_fingerprint = None
+        # wall-clock seconds of the stages computed in this run (restored stages are not timed)
+        self.timings = {}
+
+        self.persist = resume or upload
+        self.localDir = f"{config.checkpointDirBase}/{exec_id}"
+        if self.persist and not os.path.exists(self.localDir):
+            os.makedirs(self.localDir)
+
+    def run(self, stage, inputs, fn):
+        stage_fp = fingerprint(self.last_fingerprint, stage, inputs)
+        self.last_fingerprint = stage_fp
+
+        if self.resume and self.completed.get(stage) == stage_fp:
+            started = time.time()
+            found, df = self._load(stage)
+            if found:
+                logger.info(f"[CP] Stage '{stage}' restored from checkpoint in {time.time() - started:.1f}s, skipping")
+                return df
+            logger.warning(f"[CP] Stage '{stage}' is recorded as completed, but its checkpoint is neither on this volume nor in S3 "
+                           f"(e.g. the run that wrote it didn't upload its checkpoints and ran on another volume), recomputing it")
+
+        started = time.time()
+        df = fn()
+        self.timings[stage] = round(time.time() - started, 3)
+        self._save(stage, stage_fp, df)
+
+        return df
+
+    # :: runs a stage that is never checkpointed, only timed
+    def run_untracked(self, stage, fn):
+        started = time.time()
+        result = fn()
+        self.timings[stage] = round(time.time() - started, 3)
+        return result
+
+    def _paths(self, stage):
+        return f"{self.localDir}/{stage}.pkl", f"{self.localDir}/{stage}.json"
+
+    # :: remove the local checkpoints, once the execution is finished they are never read again
+    def cleanup(self):
+        shutil.rmtree(self.localDir, ignore_errors=True)
+
+    def _save(self, stage, stage_fp, df):
+        if self.persist:
+            data_file, meta_file = self._paths(stage)
+            meta = {
+                'stage': stage,
+                'fingerprint': stage_fp,
+                'hasData': df is not None,
+                'completedAt': round(time.time() * 1000),
+            }
+
+            if df is not None:
+                df.to_pickle(data_file)
+            with open(meta_file, 'w') as fp:
+                json.dump(meta, fp)
+
+            if self.upload:
+                if df is not None:
+                    self.s3_client.uploadCheckpoint(self.exec_id, f"{stage}.pkl", data_file)
+                    os.remove(data_file)
+                self.s3_client.uploadCheckpoint(self.exec_id, f"{stage}.json", meta_file)
+
+        self.completed[stage] = stage_fp
+        logger.info(f"[CP] Stage '{stage}' completed")
+        self.ddb_client.updateExecItemStatus(self.exec_id, 'RUNNING', logger.get_logs(), stage=stage, checkpoints=self.completed)
+
+    def _load(self, stage):
+        data_file, meta_file = self._paths(stage)
+
+        if not os.path.exists(meta_file):
+            if not self.s3_client.downloadCheckpoint(self.exec_id, f"{stage}.json", meta_file):
+                return False, None
+
+        with open(meta_file) as fp:
+            meta = json.load(fp)
+
+        if meta['fingerprint'] != self.completed.get(stage):
+            return False, None
+        if not meta['hasData']:
+            return True, None
+
+        if not os.path.exists(data_file):
+            if not self.s3_client.downloadCheckpoint(self.exec_id, f"{stage}.pkl", data_file):
+                return False, None
+
+        return True, pd.read_pickle(data_file)
@@ -24,5 +24,44 @@ assetsTableName = os.environ.get('DDB_ASSETS_TABLE')
 templatesTableName = os.environ.get('DDB_TEMPLATES_TABLE')
 executionsTableName = os.environ.get('DDB_EXECUTIONS_TABLE')
 featureImportanceTableName = os.environ.get('DDB_FEATURE_IMPORTANCE_TABLE')
+processingProfileTableName = os.environ.get('DDB_PROCESSING_PROFILE_TABLE')
+executionsFingerprintIndexName = os.environ.get('DDB_EXECUTIONS_FINGERPRINT_INDEX')
 
-autoEncoderVerbose = os.environ.get('FE_AUTOENCODER_VERBOSE', '0')
\ No newline at end of file
+autoEncoderVerbose = os.environ.get('FE_AUTOENCODER_VERBOSE', '0')
+
+# AWS clients: connection pool size, adaptive retries and timeouts (seconds)
+awsMaxPoolConnections = int(os.environ.get('FE_AWS_MAX_POOL_CONNECTIONS', '50'))
+awsMaxAttempts = int(os.environ.get('FE_AWS_MAX_ATTEMPTS', '10'))
+awsRetryMode = os.environ.get('FE_AWS_RETRY_MODE', 'adaptive')
+awsConnectTimeout = int(os.environ.get('FE_AWS_CONNECT_TIMEOUT', '10'))
+awsReadTimeout = int(os.environ.get('FE_AWS_READ_TIMEOUT', '60'))
+awsMaxTransferConcurrency = int(os.environ.get('FE_AWS_MAX_TRANSFER_CONCURRENCY', '10'))
+
+# job configuration of a SageMaker processing container
+processingJobConfigPath = '/opt/ml/config/processingjobconfig.json'
+# the processing volume of a SageMaker job doesn't outlive the job
+inProcessingJob = os.path.exists(processingJobConfigPath)
+
+# stage checkpoints: resume skips stages whose input fingerprint is unchanged
+resumeFromCheckpoint = os.environ.get('FE_RESUME', '0') == '1'
+uploadCheckpoints = os.environ.get('FE_CHECKPOINT_UPLOAD', '0') == '1'
+# on the processing volume, /tmp is on the (small) root volume of the container
+checkpointDirBase = os.environ.get('FE_CHECKPOINT_DIR', '/opt/ml/processing/checkpoints')
+
+# always recompute, even if a finished execution has the same input fingerprint
+forceRecompute = os.environ.get('FE_FORCE_RECOMPUTE', '0') == '1'
+
+# resource planner: number of execution profiles used for the calibration
+plannerMaxProfiles = int(os.environ.get('FE_PLANNER_MAX_PROFILES', '200'))
+
+# out-of-core mode: features are computed in column chunks into a disk-backed store, peak memory
+# is bounded by the budget instead of the universe size
+outOfCore = os.environ.get('FE_OUT_OF_CORE', '0') == '1'
+memoryBudgetMB = int(os.environ.get('FE_MEMORY_BUDGET_MB', '1024'))
+# on the processing volume, /tmp is on the (small) root volume of the container
+featureStoreDirBase = os.environ.get('FE_FEATURE_STORE_DIR', '/opt/ml/processing/feature-store')
+
+# process pool size for the parallel stages (1 = run in the main process, 0 = one worker per thread of the budget)
+parallelWorkers = int(os.environ.get('FE_PARALLEL_WORKERS', '1'))
+# threads shared by NumPy/BLAS, XGBoost, TensorFlow and the process pools (0 = CPUs of the container's cgroup quota)
+threadBudget = int(os.environ.get('FE_THREAD_BUDGET', '0'))
\ No newline at end of file
@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+from . import logger
+from . import config
+
+SEPARATOR = config.SEPARATOR
+
+
+# :: rolling sums over the first axis, the first window-1 rows are NaN (all rows for series shorter than the window)
+def _rolling_sum(values, window):
+    out = np.full(values.shape, np.nan)
+    if window > len(values):
+        return out
+    csum = np.cumsum(values, axis=0)
+    out[window - 1] = csum[window - 1]
+    out[window:] = csum[window:] - csum[:-window]
+    return out
+
+# :: rolling correlation and beta of every column of X against Y
+# X is (days x assets), Y is either (days,) or (days x assets); all moments are computed with
+# cumulative sums, so the cost is O(days x assets) regardless of the window size
+def rolling_corr_beta(X, Y, window):
+    X = np.asarray(X, dtype='float64')
+    Y = np.asarray(Y, dtype='float64')
+    if Y.ndim == 1:
+        Y = Y[:, None]
+
+    # centering keeps the cumulative sums small and limits the cancellation error
+    X = X - np.nanmean(X, axis=0)
+    Y = Y - np.nanmean(Y, axis=0)
+
+    sx = _rolling_sum(X, window)
+    sy = _rolling_sum(Y, window)
+    sxx = _rolling_sum(X * X, window)
+    syy = _rolling_sum(Y * Y, window)
+    sxy = _rolling_sum(X * Y, window)
+
+    cov = sxy - sx * sy / window
+    var_x = sxx - sx * sx / window
+    var_y = syy - sy * sy / window
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.sqrt(var_x * var_y)
+        beta = cov / var_y
+
+    # flat windows have no defined correlation
+    corr[~np.isfinite(corr)] = np.nan
+    beta[~np.isfinite(beta)] = np.nan
+
+    return np.clip(corr, -1.0, 1.0), beta
+
+# :: daily returns of a price vector or (days x assets) matrix, the first day and invalid returns are 0
+def daily_returns(prices):
+    prices = np.asarray(prices, dtype='float64')
+    returns = np.zeros_like(prices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = prices[1:] / prices[:-1] - 1.0
+    returns[~np.isfinite(returns)] = 0.0
+    return returns
+
+# :: assets whose cross-asset features are computed
+def get_assets_for_cross(crossAssetSettings, assetDF, columns, predicted_asset):
+    assets_for_cross = crossAssetSettings.get('assets', 'all')
+    if assets_for_cross == 'all':
+        assets_for_cross = list(assetDF['ticker'])
+    return [a for a in assets_for_cross if a in columns and a != predicted_asset]
+
+# :: per-class sums of the daily returns and class sizes (assets without a class are left out)
+def class_return_sums(returns, asset_classes):
+    class_names = [c for c in pd.unique(np.asarray(asset_classes, dtype=object)) if c is not None]
+    if len(class_names) == 0:
+        return {}, {}
+
+    # (assets x classes) membership matrix, the class sums are a single matrix product
+    membership = np.stack([np.asarray(asset_classes, dtype=object) == c for c in class_names], axis=1).astype('float64')
+    sums = returns @ membership
+
+    return { c: sums[:, j] for j, c in enumerate(class_names) }, { c: int(membership[:, j].sum()) for j, c in enumerate(class_names) }
+
+# :: correlation/beta columns of a block of assets
+# `class_sums`/`class_sizes` cover the whole universe, so the assets can be processed in separate blocks;
+# returns the columns against the predicted asset and the columns against the class average
+def cross_asset_block(returns, block_assets, block_classes, window, predicted_asset, target_returns=None, class_sums=None, class_sizes=None):
+    predicted_features = {}
+    class_features = {}
+
+    if target_returns is not None:
+        corr, beta = rolling_corr_beta(returns, target_returns, window)
+        for i, asset_id in enumerate(block_assets):
+            predicted_features[SEPARATOR.join([str(asset_id), 'CORR', str(predicted_asset)])] = corr[:, i]
+            predicted_features[SEPARATOR.join([str(asset_id), 'BETA', str(predicted_asset)])] = beta[:, i]
+
+    if class_sums is not None:
+        own_size = np.array([class_sizes.get(c, 0) for c in block_classes])
+        idx = np.flatnonzero(own_size > 1)
+        if len(idx) > 0:
+            # leave-one-out class average, so an asset is not correlated with itself
+            peer_sums = np.stack([class_sums[block_classes[i]] for i in idx], axis=1)
+            peer_average = (peer_sums - returns[:, idx]) / (own_size[idx] - 1)
+
+            corr, beta = rolling_corr_beta(returns[:, idx], peer_average, window)
+            for j, i in enumerate(idx):
+                asset_id = block_assets[i]
+                class_features[SEPARATOR.join([str(asset_id), 'CORR', 'CLASS'])] = corr[:, j]
+                class_features[SEPARATOR.join([str(asset_id), 'BETA', 'CLASS'])] = beta[:, j]
+
+    return predicted_features, class_features
+
+# :: names of the cross-asset columns, in the order add_cross_asset_features adds them
+def cross_asset_columns(assets_for_cross, asset_classes, crossAssetSettings, predicted_asset):
+    columns = []
+    if crossAssetSettings.get('againstPredicted', True):
+        for asset_id in assets_for_cross:
+            columns += [SEPARATOR.join([str(asset_id), 'CORR', str(predicted_asset)]), SEPARATOR.join([str(asset_id), 'BETA', str(predicted_asset)])]
+    if crossAssetSettings.get('againstAssetClass', True):
+        class_sizes = pd.Series([c for c in asset_classes if c is not None], dtype=object).value_counts()
+        for asset_id, c in zip(assets_for_cross, asset_classes):
+            if c is not None and class_sizes[c] > 1:
+                columns += [SEPARATOR.join([str(asset_id), 'CORR', 'CLASS']), SEPARATOR.join([str(asset_id), 'BETA', 'CLASS'])]
+    return columns
+
+# :: clear NaNs from the beginning of the columns
+def fill_leading_nans(features, index):
+    return pd.DataFrame(features, index=index).bfill(axis='index').fillna(0.0)
+
+# :: rolling correlation and beta against the predicted asset and against the asset-class average
+def add_cross_asset_features(mainDF, crossAssetSettings, assetDF, predicted_asset):
+    window = int(crossAssetSettings['window'])
+    assets_for_cross = get_assets_for_cross(crossAssetSettings, assetDF, mainDF.columns, predicted_asset)
+    logger.debug(f'Number of assets for cross-asset features: {len(assets_for_cross)}.')
+
+    if not crossAssetSettings['enabled'] or len(assets_for_cross) == 0:
+        return mainDF
+
+    # daily returns of the (days x assets) price matrix
+    returns = daily_returns(mainDF[assets_for_cross].to_numpy(dtype='float64'))
+
+    target_returns = None
+    if crossAssetSettings.get('againstPredicted', True):
+        target_returns = daily_returns(mainDF[predicted_asset].to_numpy(dtype='float64'))
+
+    classes_dict = dict(zip(assetDF['ticker'], assetDF['assetClass']))
+    asset_classes = [classes_dict.get(a) for a in assets_for_cross]
+
+    class_sums, class_sizes = None, None
+    if crossAssetSettings.get('againstAssetClass', True):
+        class_sums, class_sizes = class_return_sums(returns, asset_classes)
+
+    predicted_features, class_features = cross_asset_block(returns, assets_for_cross, asset_classes, window, predicted_asset, target_returns, class_sums, class_sizes)
+
+    cross_df = fill_leading_nans({ **predicted_features, **class_features }, mainDF.index)
+    mainDF = pd.concat([mainDF, cross_df], axis='columns')
+
+    logger.info(f"Generated {cross_df.shape[1]} rolling correlation/beta features (window={window}) for {len(assets_for_cross)} assets")
+
+    return mainDF
@@ -1,4 +1,18 @@
-import jsonpickle
+import json
+import numpy as np
+import pandas as pd
+
+# :: tickers of the assets a template needs (base assets plus TA, ARIMA and FFT assets)
+def get_assets_to_load(template, assets):
+    base_assets_ddb = template['feMeta']['baseAssets']
+
+    if base_assets_ddb == 'all':
+        return list(map(lambda x: x['ticker'], assets))
+
+    tmp_all_assetsDF = pd.DataFrame(assets)
+    tmp_assets_for_fft = list(tmp_all_assetsDF[tmp_all_assetsDF['assetClass'].isin(template['feMeta']['fftSettings']['assetClasses'])]['ticker'])
+    base_assets_tickers = base_assets_ddb
+    return list(np.unique(base_assets_tickers + template['feMeta']['taSettings']['assets'] + template['feMeta']['arimaSettings']['assets'] + tmp_assets_for_fft))
 
 # :: Split training and testing dataset
 def get_train_test_split(in_df, predicted_asset):
@@ -23,9 +37,8 @@ def save_and_upload_plot(plt, s3_client, exec_id, outputTmpDir, filename):
     plt.savefig(local_file)
     s3_client.uploadDiagram(exec_id, filename, local_file)
 
-# :: write JSON-line format into local file
-def write_dicts_to_file(path, data):
-    with open(path, "wb") as fp:
-        for d in data:
-            fp.write(jsonpickle.encode(d).encode("utf-8"))
-            fp.write("\n".encode("utf-8"))
\ No newline at end of file
+# :: append JSON lines of plain records (str, number and list values) to an open binary file
+def write_json_lines(fp, records):
+    for d in records:
+        fp.write(json.dumps(d).encode("utf-8"))
+        fp.write(b"\n")
\ No newline at end of file
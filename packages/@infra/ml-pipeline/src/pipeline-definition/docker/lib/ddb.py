@@ -1,16 +1,27 @@
-import boto3
+from boto3.dynamodb.conditions import Attr, Key
 import os
 import time
+import simplejson as json
+import lib.aws as aws
 import lib.config as config
 
+# partition of the processing profile table, bump it when the work units of resource_planner.estimate
+# change so that the planner isn't calibrated on profiles of the old units
+PROCESSING_PROFILE_VERSION = 1
+
 class DDBClient:
     def __init__(self, *args, **kwargs):
-        ddb = boto3.resource('dynamodb')
+        ddb = aws.resource('dynamodb')
         self.assetsTable = ddb.Table(config.assetsTableName)
         self.templateTable = ddb.Table(config.templatesTableName)
         self.execTable = ddb.Table(config.executionsTableName)
         self.featureImportanceTable = ddb.Table(config.featureImportanceTableName)
 
+    # :: the processing profile table is only configured for the feature engineering step
+    @property
+    def profileTable(self):
+        return aws.resource('dynamodb').Table(config.processingProfileTableName)
+
     def listAssets(self):
         resp = self.assetsTable.scan()
         return resp['Items']
@@ -33,32 +44,178 @@ class DDBClient:
 
         return resp['Item']
     
-    def updateExecItemStatus(self, id, status, logs = None):
+    def updateExecItemStatus(self, id, status, logs = None, stage = None, checkpoints = None):
+        updateExpression = "set #status = :status, #logs = :logs, #updatedAt = :updatedAt"
+        attributeNames = {
+            '#status': 'processingStepStatus',
+            '#logs': 'processingStepLogs',
+            '#updatedAt': 'updatedAt',
+        }
+        attributeValues = {
+            ':status': status,
+            ':logs': logs,
+            ':updatedAt': round(time.time() * 1000)
+        }
+
+        # record the last completed stage and the fingerprints of all completed stages
+        if stage is not None:
+            updateExpression += ", #stage = :stage"
+            attributeNames['#stage'] = 'processingStepStage'
+            attributeValues[':stage'] = stage
+        if checkpoints is not None:
+            updateExpression += ", #checkpoints = :checkpoints"
+            attributeNames['#checkpoints'] = 'processingStepCheckpoints'
+            attributeValues[':checkpoints'] = checkpoints
+
         self.execTable.update_item(
             Key = { 'Id': id },
-            UpdateExpression = "set #status = :status, #logs = :logs, #updatedAt = :updatedAt",
+            UpdateExpression = updateExpression,
+            ExpressionAttributeNames = attributeNames,
+            ExpressionAttributeValues = attributeValues
+        )
+
+    def saveFeatureImportance(self, id, data):
+        self.featureImportanceTable.update_item(
+            Key = { 'Id': id },
+            UpdateExpression = "set #data = :data, #updatedAt = :updatedAt",
             ExpressionAttributeNames = {
-                '#status': 'processingStepStatus',
-                '#logs': 'processingStepLogs',
+                '#data': 'data',
                 '#updatedAt': 'updatedAt',
             },
             ExpressionAttributeValues = {
-                ':status': status,
-                ':logs': logs,
+                ':data': data,
                 ':updatedAt': round(time.time() * 1000)
             }
         )
 
-    def saveFeatureImportance(self, id, data):
+    def saveFeaturePruning(self, id, data):
         self.featureImportanceTable.update_item(
             Key = { 'Id': id },
-            UpdateExpression = "set #data = :data, #updatedAt = :updatedAt",
+            UpdateExpression = "set #pruning = :pruning, #updatedAt = :updatedAt",
             ExpressionAttributeNames = {
-                '#data': 'data',
+                '#pruning': 'pruning',
                 '#updatedAt': 'updatedAt',
             },
             ExpressionAttributeValues = {
-                ':data': data,
+                ':pruning': data,
                 ':updatedAt': round(time.time() * 1000)
             }
-        )
\ No newline at end of file
+        )
+
+    def getFeatureImportance(self, id):
+        resp = self.featureImportanceTable.get_item(
+            Key={
+                'Id': id
+            }
+        )
+
+        return resp.get('Item')
+
+    # :: `compute_duration` is the duration of the run that computed the outputs, `duration` if not given (i.e.
+    # not reused from another execution)
+    def saveInputFingerprint(self, id, fingerprint, duration, compute_duration = None):
+        self.execTable.update_item(
+            Key = { 'Id': id },
+            UpdateExpression = "set #fingerprint = :fingerprint, #duration = :duration, #computeDuration = :computeDuration, #updatedAt = :updatedAt",
+            ExpressionAttributeNames = {
+                '#fingerprint': 'processingStepFingerprint',
+                '#duration': 'processingStepDuration',
+                '#computeDuration': 'processingStepComputeDuration',
+                '#updatedAt': 'updatedAt',
+            },
+            ExpressionAttributeValues = {
+                ':fingerprint': fingerprint,
+                ':duration': duration,
+                ':computeDuration': duration if compute_duration is None else compute_duration,
+                ':updatedAt': round(time.time() * 1000)
+            }
+        )
+
+    # measured stage timings and peak memory of the run, calibration input of the resource planner
+    def saveProcessingProfile(self, id, profile):
+        self.profileTable.put_item(
+            Item = {
+                'profileVersion': PROCESSING_PROFILE_VERSION,
+                'createdAt': round(time.time() * 1000),
+                'executionId': id,
+                'processingStepProfile': json.dumps(profile),
+            }
+        )
+
+    # forecast metrics of the trained model on the test windows
+    def saveEvaluationMetrics(self, id, metrics):
+        self.execTable.update_item(
+            Key = { 'Id': id },
+            UpdateExpression = "set #evaluation = :evaluation, #updatedAt = :updatedAt",
+            ExpressionAttributeNames = {
+                '#evaluation': 'evaluationMetrics',
+                '#updatedAt': 'updatedAt',
+            },
+            ExpressionAttributeValues = {
+                ':evaluation': json.dumps(metrics),
+                ':updatedAt': round(time.time() * 1000)
+            }
+        )
+
+    # :: latest profiles first
+    def listProcessingProfiles(self, limit = None):
+        query_kwargs = {
+            'KeyConditionExpression': Key('profileVersion').eq(PROCESSING_PROFILE_VERSION),
+            'ProjectionExpression': 'processingStepProfile',
+            'ScanIndexForward': False,
+        }
+        if limit is not None:
+            query_kwargs['Limit'] = limit
+
+        profiles = []
+        while True:
+            resp = self.profileTable.query(**query_kwargs)
+            profiles += [json.loads(item['processingStepProfile']) for item in resp['Items']]
+
+            if 'LastEvaluatedKey' not in resp or (limit is not None and len(profiles) >= limit):
+                return profiles[:limit]
+            query_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    # instance type and volume size picked by the execution launcher for the next runs of the template
+    # `templateUpdatedAt` is the version of the template the plan was made for, the launcher ignores the
+    # plan once the template is saved again
+    def saveProcessingPlan(self, template_id, plan, coefficients, template_updated_at):
+        item = {
+            'instanceType': plan['instanceType'],
+            'volumeSizeInGB': plan['volumeSizeInGB'],
+            'estimate': json.dumps(plan['estimate']),
+            'coefficients': json.dumps(coefficients),
+            'templateUpdatedAt': template_updated_at,
+            'updatedAt': round(time.time() * 1000),
+        }
+        if plan.get('failoverInstanceType') is not None:
+            item['failoverInstanceType'] = plan['failoverInstanceType']
+
+        self.templateTable.update_item(
+            Key = { 'Id': template_id },
+            UpdateExpression = "set #plan = :plan",
+            ExpressionAttributeNames = {
+                '#plan': 'processingPlan',
+            },
+            ExpressionAttributeValues = {
+                ':plan': item,
+            }
+        )
+
+    # :: finished execution with the same input fingerprint, if any
+    def findExecutionByFingerprint(self, fingerprint, exclude_id = None):
+        query_kwargs = {
+            'IndexName': config.executionsFingerprintIndexName,
+            'KeyConditionExpression': Key('processingStepFingerprint').eq(fingerprint),
+            'FilterExpression': Attr('processingStepStatus').eq('FINISHED'),
+        }
+
+        while True:
+            resp = self.execTable.query(**query_kwargs)
+            for item in resp['Items']:
+                if item['Id'] != exclude_id:
+                    return item
+
+            if 'LastEvaluatedKey' not in resp:
+                return None
+            query_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from . import resample
+
+
+# :: DeepAR dataset start and the integer offsets in `dates` where the train series and every test window end
+# `dates` are the sorted Date strings of the features; the bounds are compared as strings, the same way
+# the label slices of a Date-indexed frame resolve them. A test window is `predictionLength` periods of the template
+# frequency, with a coarser frequency the dates are the labels of the periods (see `resample.period_ends`)
+def get_bounds(dates, deepARMeta):
+    # dates of the UTC millisecond timestamps of the template
+    start_dataset = pd.Timestamp(int(deepARMeta['startDataset']), unit='ms').normalize()
+    end_training = pd.Timestamp(int(deepARMeta['endTraining']), unit='ms').normalize()
+    day_delta = pd.Timedelta(days=1)
+    period = resample.period_offset(deepARMeta['freq'])
+
+    num_test_windows = int(deepARMeta['testWindows'])
+    prediction_length = int(deepARMeta['predictionLength'])
+
+    dates = np.asarray(dates, dtype=str)
+
+    return {
+        'start': str(start_dataset),
+        'startOffset': int(np.searchsorted(dates, str(start_dataset), side='left')),
+        # pandas label slices include the upper bound, hence -day_delta
+        'trainEnd': int(np.searchsorted(dates, str(end_training - day_delta), side='right')),
+        # TODO: sliding window instead of expanding window?
+        'testEnds': [int(np.searchsorted(dates, str(end_training + k * prediction_length * period), side='right')) for k in range(1, num_test_windows + 1)],
+    }
+
+# :: first row of every series, after the leading zeros (np.trim_zeros "f") and not before the dataset start
+def series_offsets(values, start_offset):
+    nonzero = values != 0
+    first_nonzero = np.where(nonzero.any(axis=0), nonzero.argmax(axis=0), values.shape[0])
+    return np.maximum(first_nonzero, start_offset)
+
+# :: train records of the (rows x series) float array, the targets are sliced from views of the columns
+def train_records(values, offsets, bounds):
+    for j in range(values.shape[1]):
+        yield { "start": bounds['start'], "target": values[offsets[j]:bounds['trainEnd'], j].tolist() }
+
+# :: test records of one test window (0-based)
+def test_records(values, offsets, bounds, window):
+    test_end = bounds['testEnds'][window]
+    for j in range(values.shape[1]):
+        yield { "start": bounds['start'], "target": values[offsets[j]:test_end, j].tolist() }
@@ -0,0 +1,147 @@
+import json
+import numpy as np
+
+# quantiles scored by `evaluate`, the batch transform requests them in its DEEPAR_INFERENCE_CONFIG (pipeline-template/pipeline.json,
+# EVALUATION_QUANTILES of notebook/pipeline/create_pipeline.py) and passes them to the evaluation step with --quantiles
+DEFAULT_QUANTILES = ['0.1', '0.5', '0.9']
+
+# :: batch transform input of the test dataset: every test record without its last `prediction_length` values
+# the forecasts of the transform are then compared to these held-out values; records too short to
+# hold out a full window keep their first value (so the transform output stays aligned line by line)
+# and are excluded from the metrics by `load_actuals`
+# the lines are cut as strings, the target is the last key of the records written by `deepar`
+def write_transform_input(test_path, output_path, prediction_length):
+    P = int(prediction_length)
+    with open(test_path, 'r') as test_fp, open(output_path, 'w') as fp:
+        for line in test_fp:
+            start, end = line.rindex('[') + 1, line.rindex(']')
+            parts = line[start:end].rsplit(',', P)
+            head = parts[0] if len(parts) > P else line[start:end].split(',', 1)[0]
+            fp.write(line[:start] + head + line[end:])
+
+# :: (records x prediction_length) actual values of the last window of every test record, and the mask of the
+# records long enough to be scored
+# only the tail of each line is parsed
+def load_actuals(test_path, prediction_length):
+    P = int(prediction_length)
+    tails = []
+    valid = []
+    with open(test_path, 'r') as fp:
+        for line in fp:
+            body = line[line.rindex('[') + 1:line.rindex(']')]
+            parts = body.rsplit(',', P)
+            if len(parts) > P:
+                tails.extend(parts[1:])
+                valid.append(True)
+            else:
+                tails.extend(['nan'] * P)
+                valid.append(False)
+
+    actuals = np.array(tails, dtype='float64').reshape(len(valid), P)
+    return actuals, np.array(valid, dtype=bool)
+
+# :: mean and (quantiles x records x prediction_length) quantile forecasts of the batch transform output
+def load_forecasts(predictions_path, prediction_length, quantiles=DEFAULT_QUANTILES):
+    P = int(prediction_length)
+    means = []
+    quantile_values = [[] for _ in quantiles]
+    with open(predictions_path, 'r') as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            prediction = json.loads(line)
+            means.append(prediction['mean'][:P])
+            for i, q in enumerate(quantiles):
+                quantile_values[i].append(prediction['quantiles'][q][:P])
+
+    return np.array(means, dtype='float64'), np.array(quantile_values, dtype='float64')
+
+# :: value and standard deviation over the test windows, the format of the SageMaker model quality statistics
+def _metric(per_window, value):
+    value = float(value)
+    std = float(np.nanstd(per_window)) if len(per_window) > 1 else 0.0
+    return {
+        'value': value if np.isfinite(value) else None,
+        'standard_deviation': std if np.isfinite(std) else None,
+    }
+
+# :: RMSE, MAPE, weighted quantile loss and coverage of all the series and test windows at once
+# the records are (window x series) in the order of test.json (the series of the first test window, then of the
+# second, ...), so every metric is a reduction of the (windows, series, prediction_length) arrays; the
+# per-window values give the standard deviations. Records not scored (see `load_actuals`) are NaN and ignored.
+def evaluate(actuals, mean, quantile_forecasts, num_windows, quantiles=DEFAULT_QUANTILES, valid=None):
+    W = int(num_windows)
+    N, P = actuals.shape
+    if N % W != 0:
+        raise Exception(f"{N} test records can't be split into {W} test windows")
+    if mean.shape != actuals.shape or quantile_forecasts.shape[1:] != actuals.shape:
+        raise Exception(f"Forecasts {mean.shape} don't match the test records {actuals.shape}")
+
+    y = actuals.copy()
+    if valid is not None:
+        y[~valid] = np.nan
+    observed = np.isfinite(y)
+    y = y.reshape(W, N // W, P)
+    observed = observed.reshape(W, N // W, P)
+    y0 = np.where(observed, y, 0.0)
+    count = observed.sum(axis=(1, 2))
+    total = max(int(count.sum()), 1)
+
+    def window_mean(values):
+        sums = np.where(observed, values, 0.0).sum(axis=(1, 2))
+        return sums / np.maximum(count, 1), sums.sum() / total
+
+    error = mean.reshape(W, N // W, P) - y0
+    mse_w, mse = window_mean(error ** 2)
+
+    nonzero = observed & (y0 != 0)
+    ape = np.abs(error) / np.where(nonzero, np.abs(y0), 1.0)
+    ape_sums = np.where(nonzero, ape, 0.0).sum(axis=(1, 2))
+    ape_count = nonzero.sum(axis=(1, 2))
+    mape_w = ape_sums / np.maximum(ape_count, 1)
+    mape = ape_sums.sum() / max(int(ape_count.sum()), 1)
+
+    abs_y_w = np.abs(y0).sum(axis=(1, 2))
+    abs_y = max(abs_y_w.sum(), np.finfo('float64').tiny)
+
+    levels = np.array([float(q) for q in quantiles]).reshape(-1, 1, 1, 1)
+    forecasts = quantile_forecasts.reshape(len(quantiles), W, N // W, P)
+    diff = y0[np.newaxis] - forecasts
+    pinball = np.where(observed[np.newaxis], np.maximum(levels * diff, (levels - 1) * diff), 0.0)
+    pinball_w = pinball.sum(axis=(2, 3))
+    wql_w = 2 * pinball_w / np.maximum(abs_y_w, np.finfo('float64').tiny)
+    wql = 2 * pinball_w.sum(axis=1) / abs_y
+
+    below = observed[np.newaxis] & (y0[np.newaxis] <= forecasts)
+    coverage_w = below.sum(axis=(2, 3)) / np.maximum(count, 1)
+    coverage = below.sum(axis=(1, 2, 3)) / total
+
+    metrics = {
+        'rmse': _metric(np.sqrt(mse_w), np.sqrt(mse)),
+        'mse': _metric(mse_w, mse),
+        'mape': _metric(mape_w, mape),
+        'mean_wQuantileLoss': _metric(wql_w.mean(axis=0), wql.mean()),
+    }
+    for i, q in enumerate(quantiles):
+        metrics[f'wQuantileLoss[{q}]'] = _metric(wql_w[i], wql[i])
+        metrics[f'coverage[{q}]'] = _metric(coverage_w[i], coverage[i])
+
+    # :: share of the actual values inside the central interval of the outermost quantiles
+    if len(quantiles) > 1:
+        lo, hi = int(np.argmin(levels.ravel())), int(np.argmax(levels.ravel()))
+        inside = observed & (forecasts[lo] <= y0) & (y0 <= forecasts[hi])
+        inside_w = inside.sum(axis=(1, 2)) / np.maximum(count, 1)
+        metrics[f'coverage[{quantiles[lo]}-{quantiles[hi]}]'] = _metric(inside_w, inside.sum() / total)
+
+    return {
+        'regression_metrics': metrics,
+        'series': N // W,
+        'windows': W,
+        'scored': int(observed.any(axis=2).sum()),
+    }
+
+# :: metrics JSON of the batch transform output, used as the ModelMetrics statistics and by the condition step
+def evaluate_files(test_path, predictions_path, prediction_length, num_windows, quantiles=DEFAULT_QUANTILES):
+    actuals, valid = load_actuals(test_path, prediction_length)
+    mean, quantile_forecasts = load_forecasts(predictions_path, prediction_length, quantiles)
+    return evaluate(actuals, mean, quantile_forecasts, num_windows, quantiles, valid)
@@ -1,13 +1,18 @@
 import xgboost as xgb
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
 from . import logger
 from . import data_helper
 from . import config
+from . import threads
 
 SEPARATOR = config.SEPARATOR
 
+# lags of the target variable added as features
+NUM_TARGET_LAGS = 11
+
 
 def calc_feature_importance(
     mainDF, # DataFrame not containing synthetic features
@@ -20,25 +25,20 @@ def calc_feature_importance(
     ):
 
     try:
-        features_df = mainDF.copy(deep = True)
+        features_df = mainDF.drop(['Date'], axis='columns')
 
         # Create 10 order lags of the target variable
-        for i in range(1, 12):
+        for i in range(1, NUM_TARGET_LAGS + 1):
             features_df[f'day_{i}_lag_of_{predicted_asset}'] = features_df[predicted_asset].shift(-i)
 
         features_df.dropna(inplace=True)
         
-        # TEST
-        features_df.drop(['Date'], axis='columns', inplace=True)
-        
-        y = features_df[predicted_asset].copy(deep=True)
-        X = features_df.copy(deep=True)
+        y = features_df[predicted_asset]
 
         # Delete all features created by the target variable
         prefix = f"{predicted_asset}{SEPARATOR}"
-        for fe_col in [x for x in X.columns if str(x).startswith(prefix)]:
-            del X[fe_col]
-        del X[predicted_asset]
+        target_cols = [x for x in features_df.columns if str(x).startswith(prefix)]
+        X = features_df.drop(target_cols + [predicted_asset], axis='columns')
 
         cut_off_train = int(X.shape[0] * 0.8)
 
@@ -59,51 +59,224 @@ def calc_feature_importance(
 
         logger.info(f'[FI] Feature importance calculation starting...')
 
-        model = xgb.XGBRegressor(n_estimators=10, max_depth=5)
-        trained_model = model.fit(X_train._get_numeric_data(), y_train._get_numeric_data(), eval_set=eval_set,eval_metric=eval_metric, verbose=False)
+        model = xgb.XGBRegressor(n_estimators=10, max_depth=5, n_jobs=threads.budget())
+        with threads.limit(threads.budget(), 'feature_importance'):
+            trained_model = model.fit(X_train._get_numeric_data(), y_train._get_numeric_data(), eval_set=eval_set,eval_metric=eval_metric, verbose=False)
 
         logger.info(f'[FI] Feature importance calculation finished.')
 
-        feature_imp_df = pd.DataFrame({
-            'feature' : list(X.columns),
-            'importance' : list(trained_model.feature_importances_)
-        })
+        return report_feature_importance(list(X.columns), trained_model.feature_importances_, assetDF, exec_id, s3_client, ddb_client, outputTmpDir)
 
-        feature_imp_df = feature_imp_df.sort_values(by='importance', ascending=False)
+    except Exception as err:
+        logger.error(f"[FI] Error while executing feature importance: {str(err)}")
+        ddb_client.updateExecItemStatus(exec_id, 'FAILED', logger.get_logs())
 
-        # Individual Feature Importance
-        plt.figure(figsize=(20, 10), dpi=120)
-        plt.barh(feature_imp_df.head(20).feature, feature_imp_df.head(20).importance)
-        plt.title('Feature importance (top 20)')
-        data_helper.save_and_upload_plot(plt, s3_client, exec_id, outputTmpDir, 'feat_imp_individual.png')
+        raise err # throw it
 
-        # Asset class average importance
-        assetDF['ticker'] = assetDF['ticker'].apply(lambda x: x.strip())
-        assetDF['assetClass'] = assetDF['assetClass'].apply(lambda x: x.strip())
 
-        asset_classes_dict = dict(zip(assetDF.ticker, assetDF.assetClass))
+# :: plot the importances (individual and by asset class) and store them in DDB
+def report_feature_importance(features, importances, assetDF, exec_id, s3_client, ddb_client, outputTmpDir):
+    feature_imp_df = pd.DataFrame({
+        'feature' : list(features),
+        'importance' : list(importances)
+    })
 
-        feature_imp_df['base_asset'] = feature_imp_df['feature'].apply(lambda x: x.split(SEPARATOR)[0])
-        feature_imp_df['asset_class'] = feature_imp_df['base_asset'].map(asset_classes_dict)
+    feature_imp_df = feature_imp_df.sort_values(by='importance', ascending=False)
 
-        asset_class_importance_df = pd.DataFrame(feature_imp_df.groupby(by='asset_class')['importance'].mean()).reset_index()
+    # Individual Feature Importance
+    plt.figure(figsize=(20, 10), dpi=120)
+    plt.barh(feature_imp_df.head(20).feature, feature_imp_df.head(20).importance)
+    plt.title('Feature importance (top 20)')
+    data_helper.save_and_upload_plot(plt, s3_client, exec_id, outputTmpDir, 'feat_imp_individual.png')
 
-        plt.figure(figsize=(20, 10), dpi=120)
-        plt.barh(asset_class_importance_df.asset_class, asset_class_importance_df.importance)
-        plt.title('Feature importance (by asset class)')
-        data_helper.save_and_upload_plot(plt, s3_client, exec_id, outputTmpDir, 'feat_imp_by_class.png')
-        
-        logger.info(f"[FI] Feature importance data saved to DDB table '{config.featureImportanceTableName}'")
+    # Asset class average importance
+    assetDF['ticker'] = assetDF['ticker'].apply(lambda x: x.strip())
+    assetDF['assetClass'] = assetDF['assetClass'].apply(lambda x: x.strip())
+
+    asset_classes_dict = dict(zip(assetDF.ticker, assetDF.assetClass))
+
+    feature_imp_df['base_asset'] = feature_imp_df['feature'].apply(lambda x: x.split(SEPARATOR)[0])
+    feature_imp_df['asset_class'] = feature_imp_df['base_asset'].map(asset_classes_dict)
+
+    asset_class_importance_df = pd.DataFrame(feature_imp_df.groupby(by='asset_class')['importance'].mean()).reset_index()
+
+    plt.figure(figsize=(20, 10), dpi=120)
+    plt.barh(asset_class_importance_df.asset_class, asset_class_importance_df.importance)
+    plt.title('Feature importance (by asset class)')
+    data_helper.save_and_upload_plot(plt, s3_client, exec_id, outputTmpDir, 'feat_imp_by_class.png')
+    
+    logger.info(f"[FI] Feature importance data saved to DDB table '{config.featureImportanceTableName}'")
+
+    feature_imp_df.drop(['base_asset', 'asset_class'], axis='columns', inplace=True)
+
+    ddb_client.saveFeatureImportance(exec_id, {
+        'featureImportance': feature_imp_df.to_json(),
+        'byAssetClass': asset_class_importance_df.to_json(),
+    })
+
+    return feature_imp_df
 
-        feature_imp_df.drop(['base_asset', 'asset_class'], axis='columns', inplace=True)
 
-        ddb_client.saveFeatureImportance(exec_id, {
-            'featureImportance': feature_imp_df.to_json(),
-            'byAssetClass': asset_class_importance_df.to_json(),
-        })
+# :: row batches of the feature matrix (plus the target lags) for XGBoost's external memory DMatrix
+class _FeatureMatrixBatches(xgb.DataIter):
+    def __init__(self, matrix, feature_columns, feature_names, target, rows, batch_rows, cache_prefix):
+        self.matrix = matrix
+        self.feature_idx = [matrix.column_index[c] for c in feature_columns]
+        self.feature_names = feature_names
+        self.target = target
+        self.rows = rows
+        self.batch_rows = batch_rows
+        self._pos = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._pos >= len(self.rows):
+            return 0
+
+        rows = self.rows[self._pos:self._pos + self.batch_rows]
+        self._pos += self.batch_rows
+
+        lags = np.stack([self.target[rows + i] for i in range(1, NUM_TARGET_LAGS + 1)], axis=1)
+        # the names are only kept when given with every batch
+        input_data(data=np.hstack([self.matrix.values[np.ix_(rows, self.feature_idx)], lags]), label=self.target[rows], feature_names=self.feature_names)
+        return 1
+
+    def reset(self):
+        self._pos = 0
+
+# :: feature importance on a disk-backed SharedFeatureMatrix, for the out-of-core mode
+# Same model and inputs as calc_feature_importance, but XGBoost reads the training rows in
+# batches of `batch_rows` through its external memory interface instead of from a DataFrame.
+def calc_feature_importance_out_of_core(matrix, assetDF, predicted_asset, exec_id, s3_client, ddb_client, outputTmpDir, batch_rows, cache_dir):
+    try:
+        target = matrix.column(predicted_asset).copy()
+
+        # Delete all features created by the target variable
+        prefix = f"{predicted_asset}{SEPARATOR}"
+        feature_columns = [c for c in matrix.columns if c != predicted_asset and not str(c).startswith(prefix)]
+        lag_columns = [f'day_{i}_lag_of_{predicted_asset}' for i in range(1, NUM_TARGET_LAGS + 1)]
+
+        # rows with a NaN feature are dropped, the last rows have no target lags
+        valid = ~np.isnan(target)
+        for start in range(0, matrix.shape[0], batch_rows):
+            valid[start:start + batch_rows] &= ~np.isnan(matrix.values[start:start + batch_rows]).any(axis=1)
+        valid[len(valid) - NUM_TARGET_LAGS:] = False
+        for i in range(1, NUM_TARGET_LAGS + 1):
+            valid[:len(valid) - i] &= ~np.isnan(target[i:])
+        rows = np.flatnonzero(valid)
+
+        cut_off_train = int(len(rows) * 0.8)
+        logger.info(f'[FI] X train shape: {(cut_off_train, len(feature_columns) + NUM_TARGET_LAGS)}, X test shape: {(len(rows) - cut_off_train, len(feature_columns) + NUM_TARGET_LAGS)}')
+
+        logger.info(f'[FI] Feature importance calculation starting...')
+
+        batches = _FeatureMatrixBatches(matrix, feature_columns, feature_columns + lag_columns, target, rows[:cut_off_train], batch_rows, f"{cache_dir}/xgb-{exec_id}")
+        with threads.limit(threads.budget(), 'feature_importance'):
+            dtrain = xgb.DMatrix(batches, nthread=threads.budget())
+            booster = xgb.train({ 'max_depth': 5, 'tree_method': 'hist', 'objective': 'reg:squarederror', 'nthread': threads.budget() }, dtrain, num_boost_round=10)
+
+        logger.info(f'[FI] Feature importance calculation finished.')
+
+        # normalised gain, as XGBRegressor.feature_importances_
+        scores = booster.get_score(importance_type='gain')
+        total = sum(scores.values())
+        importances = [scores.get(f, 0.0) / total if total > 0 else 0.0 for f in feature_columns + lag_columns]
+
+        return report_feature_importance(feature_columns + lag_columns, importances, assetDF, exec_id, s3_client, ddb_client, outputTmpDir)
 
     except Exception as err:
         logger.error(f"[FI] Error while executing feature importance: {str(err)}")
         ddb_client.updateExecItemStatus(exec_id, 'FAILED', logger.get_logs())
 
-        raise err # throw it
\ No newline at end of file
+        raise err # throw it
+
+
+# :: pick the ranked features to keep according to `pruningSettings`
+#   topK: keep the K most important features
+#   cumulativeImportance: keep the most important features until their share of the total importance reaches the threshold
+#   correlationThreshold: drop a feature if it's correlated above the threshold with a more important kept feature
+# `chunk_size` is the number of columns per block of the correlation pruning (see `drop_correlated`), all candidates by default
+def select_features(mainDF, feature_imp_df, pruningSettings, chunk_size=None):
+    ranked = feature_imp_df[feature_imp_df['feature'].isin(mainDF.columns)].sort_values(by='importance', ascending=False)
+    candidates = list(ranked['feature'])
+    importances = ranked['importance'].to_numpy(dtype='float64')
+
+    top_k = pruningSettings.get('topK')
+    if top_k is not None:
+        candidates = candidates[:int(top_k)]
+
+    cumulative_threshold = pruningSettings.get('cumulativeImportance')
+    if cumulative_threshold is not None and importances.sum() > 0:
+        cumulative = np.cumsum(importances) / importances.sum()
+        # the feature crossing the threshold is kept as well
+        num_kept = int(np.searchsorted(cumulative, float(cumulative_threshold))) + 1
+        candidates = candidates[:num_kept]
+
+    correlation_threshold = pruningSettings.get('correlationThreshold')
+    if correlation_threshold is not None and len(candidates) > 1:
+        column = lambda name: mainDF[name].to_numpy(dtype='float64')
+        candidates = drop_correlated(candidates, column, float(correlation_threshold), chunk_size)
+
+    kept = set(candidates)
+    dropped = [f for f in ranked['feature'] if f not in kept]
+
+    return candidates, dropped
+
+# :: drop every candidate (ordered by importance) whose absolute correlation with a more important kept candidate is above the threshold
+# The correlations are computed on blocks of `chunk_size` standardised columns read through `column(name)`, against
+# the block itself and the kept candidates of the previous blocks, so at most two blocks of rows x chunk_size values
+# and a chunk_size x chunk_size correlation matrix are in memory at once. As with np.corrcoef, columns with
+# non-finite values or without variance are not correlated with any other.
+def drop_correlated(candidates, column, threshold, chunk_size=None):
+    chunk_size = max(1, int(chunk_size or len(candidates)))
+
+    # :: mean and standard deviation of every candidate, one column at a time
+    stats = []
+    for name in candidates:
+        values = column(name)
+        std = float(np.std(values)) if np.isfinite(values).all() else 0.0
+        stats.append((float(np.mean(values)), std) if std > 0 else None)
+    num_rows = len(column(candidates[0]))
+
+    def standardised(names_idx):
+        block = np.zeros((num_rows, len(names_idx)))
+        for j, i in enumerate(names_idx):
+            if stats[i] is not None:
+                mean, std = stats[i]
+                block[:, j] = (column(candidates[i]) - mean) / std
+        return block
+
+    kept = []
+    for start in range(0, len(candidates), chunk_size):
+        block_idx = list(range(start, min(start + chunk_size, len(candidates))))
+        block = standardised(block_idx)
+
+        # candidates of the block correlated with a kept candidate of a previous block
+        dropped = np.zeros(len(block_idx), dtype=bool)
+        for kept_start in range(0, len(kept), chunk_size):
+            corr = np.abs(block.T @ standardised(kept[kept_start:kept_start + chunk_size])) / num_rows
+            dropped |= (corr > threshold).any(axis=1)
+
+        # then against the more important kept candidates of the block itself
+        corr = np.abs(block.T @ block) / num_rows
+        keep_mask = ~dropped
+        for j in range(1, len(block_idx)):
+            if keep_mask[j] and (corr[j, :j][keep_mask[:j]] > threshold).any():
+                keep_mask[j] = False
+        kept += [i for i, keep in zip(block_idx, keep_mask) if keep]
+
+    return [candidates[i] for i in kept]
+
+# :: drop the low-value feature columns of mainDF (the predicted asset and its own features are not ranked, hence always kept)
+def prune_features(mainDF, feature_imp_df, pruningSettings, exec_id, ddb_client):
+    kept, dropped = select_features(mainDF, feature_imp_df, pruningSettings)
+
+    logger.info(f"[FI] Feature pruning kept {len(kept)} and dropped {len(dropped)} ranked features")
+
+    ddb_client.saveFeaturePruning(exec_id, {
+        'settings': pruningSettings,
+        'kept': kept,
+        'dropped': dropped,
+    })
+
+    return mainDF.drop(columns=dropped)
@@ -0,0 +1,43 @@
+import re
+import numpy as np
+import pandas as pd
+
+# DeepAR frequency units -> pandas offset aliases, periods are labelled with their end (Sunday, month end)
+# the asset data is daily, the intraday frequencies (H, min) can't be built from it
+FREQ_UNITS = { 'D': 'D', 'W': 'W', 'M': 'M' }
+
+# :: pandas resample rule of a DeepAR frequency string ("1D", "W", "2W", "M", ...)
+def get_rule(freq):
+    match = re.fullmatch(r'(\d*)([A-Za-z]+)', str(freq).strip())
+    if match is None or match.group(2) not in FREQ_UNITS:
+        raise Exception(f"Frequency '{freq}' is not supported, use a multiple of D, W or M")
+    multiple = int(match.group(1) or 1)
+    if multiple < 1:
+        raise Exception(f"Frequency '{freq}' is not supported, use a multiple of D, W or M")
+    return f"{multiple}{FREQ_UNITS[match.group(2)]}"
+
+# :: whether the frequency is the frequency of the asset data (no resampling)
+def is_daily(freq):
+    return get_rule(freq) == '1D'
+
+# :: offset of one period, used to place the test window ends
+def period_offset(freq):
+    return pd.tseries.frequencies.to_offset(get_rule(freq))
+
+# :: label and last row of every period of the sorted Date strings, periods without rows are skipped
+# the periods are closed and labelled on the right, so a period only contains the days up to its label
+# and a label is never before the data it holds
+def period_ends(dates, freq):
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(dates)))
+    rows = pd.Series(np.arange(len(index)), index=index)
+    last_rows = rows.resample(get_rule(freq), closed='right', label='right').last().dropna()
+    labels = last_rows.index.strftime('%Y-%m-%d').to_numpy()
+    return labels, last_rows.to_numpy(dtype='int64')
+
+# :: close prices of every period: the price of the last trading day of the period (the "close" of an OHLC bar)
+# the feature step builds every other feature on these bars, so the indicator windows count periods
+def resample_prices(mainDF, freq):
+    labels, last_rows = period_ends(mainDF['Date'], freq)
+    barsDF = mainDF.iloc[last_rows].reset_index(drop=True)
+    barsDF['Date'] = labels
+    return barsDF
@@ -0,0 +1,251 @@
+import json
+import math
+import numpy as np
+
+from . import config
+from . import data_helper
+
+GiB = 1024 ** 3
+
+# processing instance types considered by the planner: (type, vCPUs, memory GiB), cheapest first
+INSTANCE_TYPES = [
+    ('ml.m5.large', 2, 8),
+    ('ml.m5.xlarge', 4, 16),
+    ('ml.m5.2xlarge', 8, 32),
+    ('ml.m5.4xlarge', 16, 64),
+    ('ml.r5.4xlarge', 16, 128),
+    ('ml.m5.12xlarge', 48, 192),
+    ('ml.r5.8xlarge', 32, 256),
+    ('ml.m5.24xlarge', 96, 384),
+    ('ml.r5.16xlarge', 64, 512),
+    ('ml.r5.24xlarge', 96, 768),
+]
+
+# share of the instance memory the step may use (OS, container and allocator overhead)
+MEMORY_HEADROOM = 0.75
+MIN_VOLUME_SIZE_GB = 30
+
+# seconds per work unit of each stage, see `estimate` for the work units
+DEFAULT_STAGE_COEFFICIENTS = {
+    'load': 2e-6,               # assets x rows
+    'ta': 5e-6,                 # TA assets x rows
+    'arima': 4e-4,              # ARIMA fits x rows
+    'fft': 1e-6,                # FFT assets x steps x rows x log2(rows), includes the plot
+    'cross_asset': 2e-7,        # cross-asset features x rows
+    'feature_importance': 2e-7, # rows x columns
+    'pruning': 1e-8,            # rows x columns
+    'autoencoder': 1e-9,        # epochs x rows x autoencoder weights
+    'export': 4e-7,             # exported values
+}
+
+# peak memory (bytes) = base + perCell x cells of the widest frame + perExportValue x exported values
+DEFAULT_MEMORY_COEFFICIENTS = {
+    'base': 1.5 * GiB,          # python, pandas, TF and XGBoost
+    'perCell': 48,              # float64 frame plus the copies of the autoencoder and the feature importance
+    'perExportValue': 64,       # python float in the dataset lists plus its JSON line
+}
+
+# bytes written per value
+CSV_BYTES_PER_VALUE = 20
+JSON_BYTES_PER_VALUE = 20
+
+# :: weights of the autoencoder of `add_autoencoder_features` for x input columns
+def autoencoder_weights(x_dim):
+    return 600 * x_dim + 600 * 330 + 330 * x_dim + x_dim * 330 + 330 * 600 + 600 * x_dim
+
+# :: column counts, work units, output sizes and peak memory of a template on `num_rows` trading days
+def estimate(template, assets, num_rows, num_test_rows=None, coefficients=None):
+    coefficients = coefficients or {}
+    stage_coefficients = { **DEFAULT_STAGE_COEFFICIENTS, **coefficients.get('stages', {}) }
+    memory_coefficients = { **DEFAULT_MEMORY_COEFFICIENTS, **coefficients.get('memory', {}) }
+
+    feMeta = template['feMeta']
+    deepARMeta = template['deepARMeta']
+    R = int(num_rows)
+
+    tickers = data_helper.get_assets_to_load(template, assets)
+    classes = { a['ticker']: a['assetClass'] for a in assets }
+    num_assets = len(tickers)
+
+    taSettings = feMeta['taSettings']
+    ta_assets = len(taSettings['assets']) if taSettings['enabled'] else 0
+
+    arimaSettings = feMeta['arimaSettings']
+    arima_assets = len(arimaSettings['assets']) if arimaSettings['enabled'] else 0
+    refit_every = int(arimaSettings.get('refitEvery', 0))
+    out_of_sample = R - int(R * float(arimaSettings['trainSetSize']))
+    arima_fits = 1 + (math.ceil(out_of_sample / refit_every) - 1 if refit_every > 0 and out_of_sample > 0 else 0)
+
+    fftSettings = feMeta['fftSettings']
+    fft_assets = len([t for t in tickers if classes.get(t) in fftSettings['assetClasses']]) if fftSettings['enabled'] else 0
+    fft_steps = len(fftSettings['num_steps'])
+
+    crossAssetSettings = feMeta.get('crossAssetSettings', { 'enabled': False })
+    cross_columns = 0
+    if crossAssetSettings['enabled']:
+        cross_assets = crossAssetSettings.get('assets', 'all')
+        cross_assets = [t for t in (tickers if cross_assets == 'all' else cross_assets) if t in tickers and t != template['predictedAsset']]
+        if crossAssetSettings.get('againstPredicted', True):
+            cross_columns += 2 * len(cross_assets)
+        if crossAssetSettings.get('againstAssetClass', True):
+            class_sizes = {}
+            for t in cross_assets:
+                class_sizes[classes.get(t)] = class_sizes.get(classes.get(t), 0) + 1
+            cross_columns += 2 * len([t for t in cross_assets if class_sizes[classes.get(t)] > 1])
+
+    # Date + prices + 5 TA indicators + ARIMA + FFT steps + correlation/beta
+    columns = 1 + num_assets + 5 * ta_assets + arima_assets + fft_assets * fft_steps + cross_columns
+
+    # pruning keeps at most topK features (plus Date and the predicted asset)
+    pruningSettings = feMeta.get('pruningSettings', { 'enabled': False })
+    pruned_columns = columns
+    if pruningSettings['enabled'] and pruningSettings.get('topK'):
+        pruned_columns = min(columns, int(pruningSettings['topK']) + 2)
+
+    autoEncoderSettings = feMeta['autoEncoderSettings']
+    ae_dim = pruned_columns - 2
+    feature_columns = pruned_columns + ae_dim if autoEncoderSettings['enabled'] else pruned_columns
+
+    # DeepAR datasets: one series per feature column, the train series end at `endTraining`
+    series = feature_columns - 1
+    test_windows = int(deepARMeta['testWindows'])
+    prediction_length = int(deepARMeta['predictionLength'])
+    test_rows = int(num_test_rows) if num_test_rows is not None else min(R, test_windows * prediction_length)
+    train_rows = max(R - test_rows, 0)
+    train_values = series * train_rows
+    test_values = series * sum(min(R, train_rows + k * prediction_length) for k in range(1, test_windows + 1))
+    export_values = train_values + test_values
+
+    units = {
+        'load': num_assets * R,
+        'ta': ta_assets * R,
+        'arima': arima_assets * arima_fits * R,
+        'fft': fft_assets * fft_steps * R * math.log2(max(R, 2)),
+        'cross_asset': cross_columns * R,
+        'feature_importance': R * columns,
+        'pruning': R * columns if pruningSettings['enabled'] else 0,
+        'autoencoder': int(autoEncoderSettings['fitEpoch']) * R * autoencoder_weights(ae_dim) if autoEncoderSettings['enabled'] else 0,
+        'export': export_values,
+    }
+    runtimes = { stage: units[stage] * stage_coefficients[stage] for stage in units }
+
+    cells = R * max(columns, feature_columns)
+    peak_memory = memory_coefficients['base'] + memory_coefficients['perCell'] * cells + memory_coefficients['perExportValue'] * export_values
+
+    outputs = {
+        'features': R * feature_columns * CSV_BYTES_PER_VALUE,
+        'train': train_values * JSON_BYTES_PER_VALUE,
+        'test': test_values * JSON_BYTES_PER_VALUE,
+    }
+    # the pickled checkpoint of every stage and the input CSVs
+    scratch = 8 * R * (columns * 6 + feature_columns) + num_assets * R * CSV_BYTES_PER_VALUE
+
+    return {
+        'rows': R,
+        'assets': num_assets,
+        'columns': columns,
+        'featureColumns': feature_columns,
+        'cells': cells,
+        'exportValues': export_values,
+        'units': units,
+        'runtimes': runtimes,
+        'runtime': sum(runtimes.values()),
+        'peakMemory': peak_memory,
+        'outputs': outputs,
+        'scratch': scratch,
+    }
+
+# :: cheapest instance type and volume size (GB) that fit an estimate
+# `min_instance_type` keeps the instance type from going below a previous plan
+def choose_resources(estimate_, min_instance_type=None):
+    names = [name for name, _, _ in INSTANCE_TYPES]
+    instance_type = names[-1]
+    for name, _, memory in INSTANCE_TYPES:
+        if memory * GiB * MEMORY_HEADROOM >= estimate_['peakMemory']:
+            instance_type = name
+            break
+    if min_instance_type in names and names.index(min_instance_type) > names.index(instance_type):
+        instance_type = min_instance_type
+
+    disk = sum(estimate_['outputs'].values()) + estimate_['scratch']
+    volume_size = max(MIN_VOLUME_SIZE_GB, int(math.ceil(2 * disk / GiB)))
+
+    return instance_type, volume_size
+
+# :: instance type the pipeline step status handler switches the plan to when the step is killed (out of memory)
+# the instance of a finished run if it is larger than the planned one, else the next larger one than the
+# planned one and the one the run is on; None if there is none
+def failover_instance_type(instance_type, current_instance_type=None, finished=False):
+    names = [name for name, _, _ in INSTANCE_TYPES]
+    if finished and current_instance_type in names and names.index(current_instance_type) > names.index(instance_type):
+        return current_instance_type
+    position = max(names.index(t) for t in [instance_type, current_instance_type] if t in names)
+    return names[position + 1] if position + 1 < len(names) else None
+
+# :: instance type of the processing job, None outside of a SageMaker processing container
+def current_instance_type():
+    try:
+        with open(config.processingJobConfigPath) as fp:
+            return json.load(fp)['ProcessingResources']['ClusterConfig']['InstanceType']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def plan(template, assets, num_rows, num_test_rows=None, coefficients=None, min_instance_type=None, current_instance_type=None, finished=False):
+    estimate_ = estimate(template, assets, num_rows, num_test_rows, coefficients)
+    instance_type, volume_size = choose_resources(estimate_, min_instance_type)
+
+    return {
+        'instanceType': instance_type,
+        'volumeSizeInGB': volume_size,
+        'failoverInstanceType': failover_instance_type(instance_type, current_instance_type, finished),
+        'estimate': estimate_,
+    }
+
+# :: measured profile of a finished run, the input of `calibrate`
+def profile(estimate_, timings, peak_memory):
+    return {
+        'units': { stage: estimate_['units'][stage] for stage in timings },
+        'timings': timings,
+        'cells': estimate_['cells'],
+        'exportValues': estimate_['exportValues'],
+        'peakMemory': peak_memory,
+    }
+
+# :: fit the coefficients to the profiles of previous runs
+# stage runtimes are proportional to their work units (least squares through the origin); the
+# memory model is a least squares fit of the peak memory over the cell and exported value counts, or
+# a base plus a single scale of the default per-value terms when the samples can't separate them (e.g. runs of
+# one template, where both counts grow with the rows). Coefficients without enough samples keep
+# their defaults.
+def calibrate(profiles, min_samples=3):
+    stages = {}
+    for stage in DEFAULT_STAGE_COEFFICIENTS:
+        samples = [(p['units'][stage], p['timings'][stage]) for p in profiles if stage in p['timings'] and p['units'].get(stage, 0) > 0]
+        if len(samples) < min_samples:
+            continue
+        u, t = np.array(samples, dtype='float64').T
+        stages[stage] = float(np.dot(u, t) / np.dot(u, u))
+
+    memory = {}
+    samples = [p for p in profiles if p.get('peakMemory')]
+    if len(samples) >= min_samples:
+        A = np.array([[1.0, p['cells'], p['exportValues']] for p in samples])
+        y = np.array([p['peakMemory'] for p in samples], dtype='float64')
+        solution, _, rank, _ = np.linalg.lstsq(A, y, rcond=None)
+        if rank == 3 and np.all(solution >= 0):
+            memory = dict(zip(['base', 'perCell', 'perExportValue'], map(float, solution)))
+        else:
+            x = DEFAULT_MEMORY_COEFFICIENTS['perCell'] * A[:, 1] + DEFAULT_MEMORY_COEFFICIENTS['perExportValue'] * A[:, 2]
+            (base, scale), _, rank, _ = np.linalg.lstsq(np.stack([A[:, 0], x], axis=1), y, rcond=None)
+            if rank == 2 and base >= 0 and scale > 0:
+                memory = {
+                    'base': float(base),
+                    'perCell': DEFAULT_MEMORY_COEFFICIENTS['perCell'] * float(scale),
+                    'perExportValue': DEFAULT_MEMORY_COEFFICIENTS['perExportValue'] * float(scale),
+                }
+
+    return {
+        'stages': stages,
+        'memory': memory,
+        'samples': len(profiles),
+    }
@@ -1,35 +1,66 @@
-import boto3
+import botocore
 import logging
 import os
 import shutil
+import lib.aws as aws
 import lib.config as config
 
+# :: local working directories, called once per job (not per client)
+def prepare_tmp_dirs():
+    # make sure /tmp/assets exists:
+    if os.path.exists(config.assetsTmpDir):
+        shutil.rmtree(config.assetsTmpDir)
+        logging.debug(f"{config.assetsTmpDir} wiped...")
+    
+    os.makedirs(config.assetsTmpDir)
+    
+    if not os.path.exists(config.featuresTmpDir):
+        os.makedirs(config.featuresTmpDir)
+
 class S3Client:
     def __init__(self, *args, **kwargs):
-        s3 = boto3.resource('s3')
+        s3 = aws.resource('s3')
         self.assetsBucket = s3.Bucket(config.assetsBucketName)
         self.modelsBucket = s3.Bucket(config.modelsBucketName)
-        
-        # make sure /tmp/assets exists:
-        if os.path.exists(config.assetsTmpDir):
-            shutil.rmtree(config.assetsTmpDir)
-            logging.debug(f"{config.assetsTmpDir} wiped...")
-        
-        os.makedirs(config.assetsTmpDir)
-        
-        if not os.path.exists(config.featuresTmpDir):
-            os.makedirs(config.featuresTmpDir)
+        self.transferConfig = aws.transfer_config()
 
     def downloadAsset(self, asset):
         filename = f"{asset['ticker']}.csv"
         logging.debug(f"Downloading {asset['bucketKey']} from bucket {config.assetsBucketName}")
-        self.assetsBucket.download_file(asset['bucketKey'], f"{config.assetsTmpDir}/{filename}")
+        self.assetsBucket.download_file(asset['bucketKey'], f"{config.assetsTmpDir}/{filename}", Config=self.transferConfig)
 
     def uploadToModels(self, exec_id, bucket_key, local_file):
-        self.modelsBucket.upload_file(local_file, f"execution/{exec_id}/{bucket_key}")
+        self.modelsBucket.upload_file(local_file, f"execution/{exec_id}/{bucket_key}", Config=self.transferConfig)
         
     def uploadFeatureCsv(self, exec_id, local_file):
         self.uploadToModels(exec_id, 'training/features.csv', local_file)
 
     def uploadDiagram(self, exec_id, filename, local_file):
-        self.uploadToModels(exec_id, f'plots/{filename}', local_file)
\ No newline at end of file
+        self.uploadToModels(exec_id, f'plots/{filename}', local_file)
+
+    def downloadFromModels(self, exec_id, bucket_key, local_file):
+        try:
+            self.modelsBucket.download_file(f"execution/{exec_id}/{bucket_key}", local_file, Config=self.transferConfig)
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise err
+
+        return True
+
+    def uploadCheckpoint(self, exec_id, filename, local_file):
+        self.uploadToModels(exec_id, f'checkpoints/{filename}', local_file)
+
+    def downloadCheckpoint(self, exec_id, filename, local_file):
+        return self.downloadFromModels(exec_id, f'checkpoints/{filename}', local_file)
+
+    # :: copy every object under execution/<src_exec_id>/<prefix> to the same key of dst_exec_id
+    def copyModelsPrefix(self, src_exec_id, dst_exec_id, prefix):
+        src_prefix = f"execution/{src_exec_id}/{prefix}"
+        copied = 0
+        for obj in self.modelsBucket.objects.filter(Prefix=src_prefix):
+            dst_key = f"execution/{dst_exec_id}/{prefix}{obj.key[len(src_prefix):]}"
+            self.modelsBucket.copy({ 'Bucket': config.modelsBucketName, 'Key': obj.key }, dst_key, Config=self.transferConfig)
+            copied += 1
+
+        return copied
\ No newline at end of file
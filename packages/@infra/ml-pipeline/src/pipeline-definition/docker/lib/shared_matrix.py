@@ -0,0 +1,106 @@
+import os
+import uuid
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+
+# :: float64 (rows x columns) matrix in shared memory or in a memory-mapped file
+# Columns are stored contiguously (Fortran order) and addressed by name, so workers attach with
+# a small picklable handle instead of receiving a pickled DataFrame, and write their output
+# columns into slots preallocated by the parent.
+class SharedFeatureMatrix:
+    def __init__(self, num_rows, columns, path=None, _handle=None, readonly=False):
+        self.columns = list(columns)
+        self.column_index = { name: i for i, name in enumerate(self.columns) }
+        self.shape = (int(num_rows), len(self.columns))
+        self.path = path
+        self._shm = None
+        self._owner = _handle is None
+
+        nbytes = max(self.shape[0] * self.shape[1] * 8, 1)
+
+        if path is not None:
+            mode = ('r' if readonly else 'r+') if _handle is not None else 'w+'
+            self.values = np.memmap(path, dtype='float64', mode=mode, shape=self.shape, order='F')
+        else:
+            if _handle is None:
+                self._shm = shared_memory.SharedMemory(create=True, size=nbytes, name=f"fe-{uuid.uuid4().hex[:16]}")
+            else:
+                self._shm = shared_memory.SharedMemory(name=_handle['name'])
+            self.values = np.ndarray(self.shape, dtype='float64', buffer=self._shm.buf, order='F')
+
+        if readonly:
+            self.values.flags.writeable = False
+
+    # :: allocate the matrix and copy the given float columns of a DataFrame into it
+    @classmethod
+    def from_frame(cls, df, columns=None, extra_columns=None, path=None):
+        columns = list(columns) if columns is not None else [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+        matrix = cls(df.shape[0], columns + list(extra_columns or []), path=path)
+        for i, name in enumerate(columns):
+            matrix.values[:, i] = df[name].to_numpy(dtype='float64')
+        if extra_columns:
+            matrix.values[:, len(columns):] = np.nan
+
+        return matrix
+
+    # :: attach to a matrix created in another process
+    @classmethod
+    def attach(cls, handle, readonly=True):
+        return cls(handle['shape'][0], handle['columns'], path=handle['path'], _handle=handle, readonly=readonly)
+
+    # :: picklable description of the matrix for the workers
+    def handle(self):
+        return {
+            'name': self._shm.name if self._shm is not None else None,
+            'path': self.path,
+            'shape': self.shape,
+            'columns': self.columns,
+        }
+
+    # :: contiguous view of a single column
+    def column(self, name):
+        return self.values[:, self.column_index[name]]
+
+    def set_column(self, name, values):
+        self.values[:, self.column_index[name]] = values
+
+    # :: DataFrame over the matrix; no data is copied, so writes through it land in the matrix
+    def to_frame(self, columns=None, index=None):
+        if columns is None:
+            return pd.DataFrame(self.values, columns=self.columns, index=index, copy=False)
+
+        idx = [self.column_index[c] for c in columns]
+        # contiguous column ranges stay views, others are gathered
+        if idx == list(range(idx[0], idx[0] + len(idx))):
+            values = self.values[:, idx[0]:idx[0] + len(idx)]
+        else:
+            values = self.values[:, idx]
+        return pd.DataFrame(values, columns=list(columns), index=index, copy=False)
+
+    # :: write the dirty pages of a file-backed matrix to disk
+    def flush(self):
+        if isinstance(self.values, np.memmap):
+            self.values.flush()
+
+    def close(self):
+        self.values = None
+        if self._shm is not None:
+            self._shm.close()
+
+    # :: release the matrix, only the creating process removes the backing memory/file
+    def release(self):
+        self.close()
+        if not self._owner:
+            return
+        if self._shm is not None:
+            self._shm.unlink()
+        elif self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -0,0 +1,99 @@
+import math
+import os
+from contextlib import contextmanager
+
+from . import logger
+from . import config
+
+# environment variables read by the BLAS/OpenMP libraries when they are loaded (process pool workers)
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+_budget = None
+
+# :: CPU limit of the container's cgroup (cgroup v2 cpu.max or v1 cfs quota/period), None if unlimited
+def cgroup_cpu_quota():
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as fp:
+            quota, period = fp.read().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    for cgroup_dir in ['/sys/fs/cgroup/cpu', '/sys/fs/cgroup/cpu,cpuacct']:
+        try:
+            with open(f"{cgroup_dir}/cpu.cfs_quota_us") as fp:
+                quota = int(fp.read())
+            with open(f"{cgroup_dir}/cpu.cfs_period_us") as fp:
+                period = int(fp.read())
+            if quota > 0 and period > 0:
+                return quota / period
+            return None
+        except (OSError, ValueError):
+            continue
+
+    return None
+
+# :: CPUs the step can use: the CPUs it may be scheduled on, capped by the cgroup quota
+# the libraries size their pools by the CPUs of the host, which oversubscribes a container with a quota
+def available_cpus():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return max(1, cpus)
+
+# :: threads of the whole step, FE_THREAD_BUDGET overrides the detected CPUs
+def budget():
+    global _budget
+    if _budget is None:
+        _budget = config.threadBudget if config.threadBudget > 0 else available_cpus()
+        logger.info(f"Thread budget: {_budget} (CPUs: {os.cpu_count()}, cgroup quota: {cgroup_cpu_quota()})")
+    return _budget
+
+# :: process pool size of a parallel stage, 0 requested workers = one per thread of the budget
+def pool_size(requested, tasks):
+    workers = budget() if requested <= 0 else min(requested, budget())
+    return max(1, min(workers, tasks))
+
+# :: threads of every worker of a pool, the budget is split between the workers
+def worker_threads(workers):
+    return max(1, budget() // max(1, workers))
+
+# :: limit the BLAS/OpenMP thread pools (NumPy, SciPy, statsmodels, XGBoost's OpenMP) within a block
+# without threadpoolctl the pools keep their defaults
+@contextmanager
+def limit(threads, stage=None):
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.debug(f"threadpoolctl is not installed, the thread pools of stage '{stage}' are not limited")
+        yield threads
+        return
+
+    with threadpool_limits(limits=threads):
+        logger.debug(f"Stage '{stage}' limited to {threads} BLAS/OpenMP threads")
+        yield threads
+
+# :: process pool initializer, the worker's libraries get `threads` threads for the lifetime of the worker
+def init_worker(threads):
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=threads)
+    except ImportError:
+        pass
+
+# :: TensorFlow intra-op (within an op, e.g. a matmul) and inter-op (independent ops) threads
+# they can only be set before TensorFlow runs its first op, later calls keep the first configuration
+def configure_tensorflow(threads):
+    import tensorflow as tf
+    inter_op = min(2, threads)
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+        logger.debug(f"TensorFlow limited to {threads} intra-op and {inter_op} inter-op threads")
+    except RuntimeError:
+        logger.debug("TensorFlow is already initialized, its thread pools are not changed")
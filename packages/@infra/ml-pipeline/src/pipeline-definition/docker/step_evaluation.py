@@ -0,0 +1,54 @@
+# # MODEL EVALUATION
+#
+# 1. Fetch the training template of the execution (prediction length, test windows)
+# 2. Load the last window of every test series (test.json) and the batch transform forecasts
+# 3. Compute the forecast metrics of all the series at once
+# 4. Store the metrics JSON (ModelMetrics statistics, condition step input) and save it to the execution item
+# 5. Fail the step if the mean weighted quantile loss is not finite (the condition step can't compare a null value)
+
+import os
+import time
+import simplejson as json
+
+import lib.config as config
+from lib.ddb import DDBClient
+import lib.logger as logger
+import lib.evaluation as evaluation
+
+# processing step inputs and output
+TEST_DIR = f"{config.baseDir}/input/test"
+PREDICTIONS_DIR = f"{config.baseDir}/input/predictions"
+EVALUATION_DIR = f"{config.baseDir}/evaluation"
+
+def run_step(exec_id, quantiles=evaluation.DEFAULT_QUANTILES):
+    if not exec_id:
+        raise Exception('exec_id parameter not set. Quitting...')
+
+    started = time.time()
+    ddbClient = DDBClient()
+
+    execution_instance = ddbClient.getTrainingExecutionItem(exec_id)
+    template = ddbClient.getTrainingTemplate(execution_instance['templateId'])
+    deepARMeta = template['deepARMeta']
+    logger.info(f"Model evaluation started. exec_id={exec_id}, template_id={execution_instance['templateId']}")
+
+    # the batch transform writes <input file>.out
+    test_path = f"{TEST_DIR}/test.json"
+    predictions_path = f"{PREDICTIONS_DIR}/input.json.out"
+
+    metrics = evaluation.evaluate_files(test_path, predictions_path, deepARMeta['predictionLength'], deepARMeta['testWindows'], quantiles)
+    regression_metrics = metrics['regression_metrics']
+    logger.info(f"Evaluated {metrics['scored']} of {metrics['series'] * metrics['windows']} test series in {time.time() - started:.1f}s: "
+                f"RMSE={regression_metrics['rmse']['value']}, MAPE={regression_metrics['mape']['value']}, mean wQL={regression_metrics['mean_wQuantileLoss']['value']}")
+
+    if not os.path.exists(EVALUATION_DIR):
+        os.makedirs(EVALUATION_DIR)
+    with open(f"{EVALUATION_DIR}/evaluation.json", 'w') as fp:
+        json.dump(metrics, fp)
+
+    ddbClient.saveEvaluationMetrics(exec_id, metrics)
+    logger.info(f"Evaluation metrics saved to {EVALUATION_DIR}/evaluation.json")
+
+    # non-finite metrics are written as null, on which the JsonGet of the condition step fails with an unrelated error
+    if regression_metrics['mean_wQuantileLoss']['value'] is None:
+        raise Exception(f"The mean weighted quantile loss of execution {exec_id} is not finite (NaN or infinite forecasts), the model can't be evaluated")
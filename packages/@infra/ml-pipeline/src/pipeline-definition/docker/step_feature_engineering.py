@@ -10,33 +10,781 @@
 # 
 # 6. Store fully built FE CSV
 
+import hashlib
+import math
 import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
 import os
+import resource
+import shutil
+import time
 import pandas as pd 
 import simplejson as json
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
 
 # Import internal helper packages
 import lib.config as config
 from lib.ddb import DDBClient
-from lib.s3 import S3Client
+from lib.s3 import S3Client, prepare_tmp_dirs
 import lib.logger as logger
 import lib.data_helper as data_helper
 import lib.feature_importance as feature_importance
+import lib.cross_asset as cross_asset
+import lib.arima as arima
+import lib.deepar as deepar
+import lib.evaluation as evaluation
+import lib.resample as resample
+import lib.threads as threads
+import lib.resource_planner as resource_planner
+from lib.shared_matrix import SharedFeatureMatrix
+from lib.checkpoint import CheckpointStore, file_digest, fingerprint
 
 logger.info(f"Contents of {config.ASSETS_DIR}: {len(os.listdir(config.ASSETS_DIR))} CSVs")
 
 SEPARATOR = config.SEPARATOR
+# part of the input fingerprints, bump it when a change of this step or lib/ changes the features of the same
+# inputs, so that the outputs and stage checkpoints of earlier versions aren't reused
+FEATURE_VERSION = 1
 # ---
 
-def run_step(exec_id):
+# :: read a single asset CSV as a (Date, <ticker>) frame
+def read_asset_csv(asset_ticker):
+    df = pd.read_csv(f"{config.ASSETS_DIR}/{asset_ticker}.csv")
+    df.columns = ['Date', asset_ticker]
+    return df
+
+# :: key of a cached feature block, only valid for the exact same set of rows
+# the digest covers every Date, joins of assets with different holiday calendars can have the
+# same length and endpoints but different rows in between
+def _feature_key(mainDF, *parts):
+    dates_digest = hashlib.sha1(mainDF['Date'].to_numpy(dtype=str).tobytes()).hexdigest()
+    return (dates_digest,) + parts
+
+# :: compute a block of feature columns, or take it from the batch feature cache
+def _cached_columns(cache, key, compute):
+    if cache is None:
+        return compute()
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+# :: load the asset CSVs and inner-join them on Date, resampled to the template frequency
+def load_asset_data(assets_to_load_tickers, frames=None, freq='1D'):
+    mainDF = None
+
+    for asset_ticker in assets_to_load_tickers:
+        if frames is not None and asset_ticker in frames:
+            # the batch frames are shared between executions, never mutate them
+            df = frames[asset_ticker].copy()
+        elif os.path.exists(f"{config.ASSETS_DIR}/{asset_ticker}.csv"):
+            df = read_asset_csv(asset_ticker)
+        else:
+            continue
+        
+        if mainDF is None:
+            mainDF = df
+            continue
+
+        mainDF = mainDF.merge(df, how='inner', on='Date')
+
+    # :: coarser frequencies -> one row per period, every feature is built on these rows
+    if mainDF is not None and not resample.is_daily(freq):
+        num_days = len(mainDF)
+        mainDF = resample.resample_prices(mainDF, freq)
+        logger.info(f"Prices resampled to the template frequency {freq}: {num_days} trading days -> {len(mainDF)} periods")
+
+    return mainDF
+
+# :: Bollinger bands, RSI and SMA for the configured assets
+def add_ta_features(mainDF, taSettings, cache=None):
+    assets_for_ta = taSettings['assets']
+    logger.debug(f'Number of assets for technical indicators: {len(assets_for_ta)}.')
+
+    # :: TA vars
+    bb_window = int(taSettings['bollingerBand']['window'])
+    bb_window_dev = int(taSettings['bollingerBand']['window_dev'])
+    rsi_window = int(taSettings['rsi']['window'])
+    sma_window = int(taSettings['sma']['window'])
+    logger.debug(f"bb_window={bb_window} | bb_window_dev={bb_window_dev} | rsi_window={rsi_window} | sma_window={sma_window}")
+
+    if not taSettings['enabled']:
+        return mainDF
+
+    from ta.volatility import BollingerBands
+    from ta.momentum import RSIIndicator
+    from ta.trend import SMAIndicator, EMAIndicator
+
+    def compute(asset_id):
+        indicator_bb = BollingerBands(close=mainDF[asset_id], window=bb_window, window_dev=bb_window_dev)
+
+        upCol = SEPARATOR.join([str(asset_id), 'BB', 'Up'])
+        lowCol = SEPARATOR.join([str(asset_id), 'BB', 'Low'])
+        maCol = SEPARATOR.join([str(asset_id), 'BB', 'MA'])
+        rsiCol = SEPARATOR.join([str(asset_id), 'RSI'])
+        smaCol = SEPARATOR.join([str(asset_id), 'SMA'])
+
+        ta_df = pd.DataFrame(index=mainDF.index)
+        ta_df[upCol] = indicator_bb.bollinger_hband()
+        ta_df[lowCol] = indicator_bb.bollinger_lband()
+        ta_df[maCol] = indicator_bb.bollinger_mavg()
+        
+        rsa_indicator = RSIIndicator(close=mainDF[asset_id], window=rsi_window)
+        ta_df[rsiCol] = rsa_indicator.rsi()
+
+        sma_indicator = SMAIndicator(close=mainDF[asset_id], window=sma_window)
+        ta_df[smaCol] = sma_indicator.sma_indicator()
+        
+        # clear NaNs from the beginning of the columns
+        return ta_df.fillna(axis='index', method='backfill')
+
+    for asset_id in assets_for_ta:
+        key = _feature_key(mainDF, 'ta', asset_id, bb_window, bb_window_dev, rsi_window, sma_window)
+        ta_df = _cached_columns(cache, key, lambda: compute(asset_id))
+        for col in ta_df.columns:
+            mainDF[col] = ta_df[col].values
+    
+    logger.info(f"Generated BB Up/Low/MA, RSI and SMA indicators for {len(assets_for_ta)} assets")
+
+    return mainDF
+
+# :: rolling one-step-ahead ARIMA forecasts of a single price series
+def arima_feature(X, trainSetSize, refitEvery=0):
+    size = int(len(X) * trainSetSize)
+    return arima.walk_forward_forecast(X, size, order=(5,1,0), refit_every=refitEvery)
+
+# start method of the ARIMA process pool: forked children of a step that already started XGBoost's OpenMP or
+# TensorFlow's thread pools (the previous executions of a batch) can deadlock on their locks, so the workers
+# are forked from a fork server that only imported this module
+ARIMA_MP_CONTEXT = multiprocessing.get_context('forkserver')
+ARIMA_MP_CONTEXT.set_forkserver_preload([__name__])
+
+# :: process pool worker, reads the price column from the shared matrix and writes into its ARIMA slot
+def _arima_worker(args):
+    handle, asset_id, arimaColName, trainSetSize, refitEvery = args
+    matrix = SharedFeatureMatrix.attach(handle, readonly=False)
+    try:
+        matrix.set_column(arimaColName, arima_feature(matrix.column(asset_id), trainSetSize, refitEvery))
+    finally:
+        matrix.close()
+    return arimaColName
+
+# :: ARIMA feature for the configured assets
+def add_arima_features(mainDF, arimaSettings, cache=None, workers=1):
+    assets_for_arima = arimaSettings['assets']
+    logger.debug(f'Number of assets for ARIMA: {len(assets_for_arima)}.')
+
+    if not arimaSettings['enabled']:
+        return mainDF
+
+    trainSetSize = float(arimaSettings['trainSetSize'])
+    # re-estimate the parameters every N out-of-sample observations (0 = fit once)
+    refitEvery = int(arimaSettings.get('refitEvery', 0))
+    cache = cache if cache is not None else {}
+    keys = { asset_id: _feature_key(mainDF, 'arima', asset_id, trainSetSize, refitEvery) for asset_id in assets_for_arima }
+    to_compute = [asset_id for asset_id in assets_for_arima if keys[asset_id] not in cache]
+    workers = threads.pool_size(workers, len(to_compute))
+
+    if workers > 1:
+        # the workers attach to the price columns instead of receiving a pickled mainDF
+        arima_cols = [SEPARATOR.join([str(asset_id), 'ARIMA']) for asset_id in to_compute]
+        with SharedFeatureMatrix.from_frame(mainDF, columns=to_compute, extra_columns=arima_cols) as matrix:
+            # the workers split the thread budget, instead of each sizing its BLAS pools to all the CPUs
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ARIMA_MP_CONTEXT, initializer=threads.init_worker, initargs=(threads.worker_threads(workers),)) as pool:
+                list(pool.map(_arima_worker, [(matrix.handle(), asset_id, col, trainSetSize, refitEvery) for asset_id, col in zip(to_compute, arima_cols)]))
+            for asset_id, col in zip(to_compute, arima_cols):
+                cache[keys[asset_id]] = matrix.column(col).copy()
+    else:
+        for asset_id in to_compute:
+            cache[keys[asset_id]] = arima_feature(mainDF[asset_id], trainSetSize, refitEvery)
+
+    for asset_id in assets_for_arima:
+        arimaColName = SEPARATOR.join([str(asset_id), 'ARIMA'])
+        mainDF[arimaColName] = cache[keys[asset_id]]
+    
+    logger.info(f"Generated ARIMA feature for {len(assets_for_arima)} assets")
+
+    return mainDF
+
+# :: low-pass Fourier reconstructions for the assets of the configured asset classes
+def add_fft_features(mainDF, fftSettings, assets_for_fft, s3Client, exec_id, outputTmpDir, cache=None, plot=True):
+    logger.debug(f'Number of assets for Fourier transforms: {len(assets_for_fft)}.')
+
+    if not fftSettings['enabled']:
+        return mainDF
+
+    fft_num_comp = int(fftSettings['num_comp'])
+    num_steps = [int(num_) for num_ in fftSettings['num_steps']]
+
+    def compute(asset_id):
+        # discrete Fourier transformation
+        fft_list = np.fft.fft(mainDF[asset_id])
+
+        fft_columns = {}
+        for num in num_steps:
+            fft_list_m10 = np.copy(fft_list)
+            fft_list_m10[num:-num] = 0
+            
+            fftColName = SEPARATOR.join([str(asset_id), 'FT', str(num)])
+            fft_columns[fftColName] = np.fft.ifft(fft_list_m10).real
+        return fft_columns
+
+    for asset_id in assets_for_fft:
+        key = _feature_key(mainDF, 'fft', asset_id, tuple(num_steps))
+        for fftColName, values in _cached_columns(cache, key, lambda: compute(asset_id)).items():
+            mainDF[fftColName] = values
+            
+    logger.info(f"Generated {len(fftSettings['num_steps'])} FFT step features for {len(assets_for_fft)} assets")
+
+    # --- plot FFT components (of the last asset)
+    if plot and len(assets_for_fft) > 0:
+        plot_fft_components(mainDF[assets_for_fft[-1]], s3Client, exec_id, outputTmpDir)
+
+    return mainDF
+
+def plot_fft_components(X, s3Client, exec_id, outputTmpDir):
+    from collections import deque
+    fft_abs = np.abs(np.fft.fft(X))
+    items = deque(fft_abs)
+    items.rotate(int(np.floor(len(fft_abs)/2)))
+    plt.figure(figsize=(15, 10), dpi=80)
+    plt.stem(items)
+    plt.title('Components of Fourier transforms')
+    data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'fft-components.png')
+
+# :: compiled autoencoder for x_dim input columns
+def build_autoencoder(x_dim, autoEncoderSettings):
+    from tensorflow.keras.layers import Dense
+    from tensorflow.keras.models import Sequential
+
+    threads.configure_tensorflow(threads.budget())
+
+    autoencoder = Sequential()
+    
+    autoencoder.add(Dense(600, activation='sigmoid', input_dim=x_dim))
+    autoencoder.add(Dense(330, activation='relu', input_dim=600))
+    autoencoder.add(Dense(x_dim, activation='relu', input_dim=330))
+    autoencoder.add(Dense(330, activation='relu', input_dim=x_dim))
+    autoencoder.add(Dense(600, activation='relu', input_dim=330))
+    autoencoder.add(Dense(x_dim, activation='sigmoid', input_dim=600))
+    
+    autoencoder.compile(optimizer=autoEncoderSettings['optimizer'], loss=autoEncoderSettings['loss'])
+    autoencoder.summary()
+
+    return autoencoder
+
+# -- plot loss
+def plot_autoencoder_loss(history, s3Client, exec_id, outputTmpDir):
+    plt.plot(history.history['val_loss'], label='val_loss')
+    # plt.plot(history.history['loss'], label='loss')
+    plt.legend()
+    plt.title('Validation loss of Autoencoders')
+    plt.xlabel('Epoch')
+    data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'validation-loss-autoencoder.png')
+
+# :: train the autoencoder on mainDF and append its outputs as synthetic features
+def add_autoencoder_features(mainDF, predicted_asset, autoEncoderSettings, s3Client, exec_id, outputTmpDir):
+    (X_train, y_train), (X_test, y_test) = data_helper.get_train_test_split(mainDF.copy(deep=True), predicted_asset)
+    
+    logger.debug(f"mainDF dim: {len(list(mainDF.columns))}")
+    logger.debug(f"training set dim: {len(list(X_train.columns))}")
+    logger.debug(f"testing set dim: {len(list(X_test.columns))}")
+    
+    autoencoder = build_autoencoder(len(list(X_train.columns)), autoEncoderSettings)
+    
+    history = autoencoder.fit(
+        x=X_train,
+        y=X_train,
+        epochs=int(autoEncoderSettings['fitEpoch']),
+        batch_size=int(autoEncoderSettings['fitBatchSize']),
+        shuffle=bool(autoEncoderSettings['fitShuffle']),
+        validation_data=(X_test, X_test),
+        verbose=int(config.autoEncoderVerbose) # 0=silent
+    )
+
+    logger.info(f"Autoencoder ran successfully [{history}]")
+
+    plot_autoencoder_loss(history, s3Client, exec_id, outputTmpDir)
+
+    autoencoder_predictions = autoencoder.predict(mainDF.drop(['Date', predicted_asset], axis='columns', inplace=False).values)
+
+    assert mainDF.shape[0] == autoencoder_predictions.shape[0], 'Something is wrong with merging data autoencoder features with the other features'
+
+    autoencoder_predictions_df = pd.DataFrame(autoencoder_predictions)
+    autoencoder_predictions_df['Date'] = mainDF['Date']
+    featuresDF = mainDF.merge(autoencoder_predictions_df, left_on='Date', right_on='Date')
+    # featuresDF.drop('Date',axis=1, inplace=True) # I DON'T SEE WHY WE NEED TO DO THIS
+
+    logger.info(f'Number of synthetic features (AE): {autoencoder_predictions_df.shape[1] - 1}.')
+
+    return featuresDF
+
+# :: number of assets per asset class
+def plot_asset_classes(assetDF, s3Client, exec_id, outputTmpDir):
+    pd.DataFrame(assetDF.groupby('assetClass')['assetClass'].count()).rename(columns={'assetClass' : 'Count'}).reset_index().sort_values(by='Count', ascending=True).plot(kind='barh', x='assetClass', y='Count', figsize=(12, 7))
+    data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'assets-per-class.png')
+
+def plot_autocorrelation(X, s3Client, exec_id, outputTmpDir):
+    plt.figure(figsize=(8, 7), dpi=120)
+    from pandas.plotting import autocorrelation_plot
+    autocorrelation_plot(X)
+    data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'autocorrelation.png')
+
+# :: local ProcessingOutput files of an execution
+def get_output_paths(exec_id, per_execution_dirs=False):
+    subdir = f"/{exec_id}" if per_execution_dirs else ''
+    for output in ['features', 'train', 'test', 'evaluation']:
+        if not os.path.exists(f"{config.baseDir}/{output}{subdir}"):
+            os.makedirs(f"{config.baseDir}/{output}{subdir}")
+
+    return {
+        'training/features.csv': f"{config.baseDir}/features{subdir}/features.csv",
+        'data/train/train.json': f"{config.baseDir}/train{subdir}/train.json",
+        'data/test/test.json': f"{config.baseDir}/test{subdir}/test.json",
+        'data/evaluation/input.json': f"{config.baseDir}/evaluation{subdir}/input.json",
+    }
+
+# :: batch transform input of the model evaluation, derived from test.json
+def export_evaluation_input(output_paths, deepARMeta, s3Client, exec_id):
+    evaluation_input_path = output_paths['data/evaluation/input.json']
+    evaluation.write_transform_input(output_paths['data/test/test.json'], evaluation_input_path, deepARMeta['predictionLength'])
+    s3Client.uploadToModels(exec_id, 'data/evaluation/input.json', evaluation_input_path)
+    logger.info(f"Evaluation input generated and uploaded to {config.modelsBucketName}/{exec_id}/data/evaluation/input.json")
+
+# :: write features.csv and the DeepAR train/test JSON-line datasets, and upload them to S3
+def export_deepar_datasets(featuresDF, deepARMeta, s3Client, exec_id, per_execution_dirs=False):
+    output_paths = get_output_paths(exec_id, per_execution_dirs)
+
+    # features_local_file = f"{config.featuresTmpDir}/{exec_id}-features.csv"
+    features_local_file = output_paths['training/features.csv']
+    featuresDF.to_csv(features_local_file)
+    s3Client.uploadFeatureCsv(exec_id, features_local_file)
+    logger.info(f'Features CSV uploaded to {config.modelsBucketName}/{exec_id}/training/features.csv')
+
+    # :: one float array of all the series, the dates are resolved to row offsets once
+    values = featuresDF.drop(columns='Date').to_numpy(dtype='float64')
+    bounds = deepar.get_bounds(featuresDF['Date'].to_numpy(), deepARMeta)
+    offsets = deepar.series_offsets(values, bounds['startOffset'])
+    num_timeseries = values.shape[1]
+
+    # training_data_file_path = f"{config.featuresTmpDir}/train-{exec_id}.json"
+    # test_data_file_path = f"{config.featuresTmpDir}/test-{exec_id}.json"
+    training_data_file_path = output_paths['data/train/train.json']
+    test_data_file_path = output_paths['data/test/test.json']
+
+    with open(training_data_file_path, 'wb') as fp:
+        data_helper.write_json_lines(fp, deepar.train_records(values, offsets, bounds))
+    logger.info(f"Training data generated. Data length={num_timeseries}")
+    logger.info(f"Training data generated in JSON set as 'train' in ProcessingOutput at {training_data_file_path}")
+
+    # the series of the first test window, then of the second, ...
+    with open(test_data_file_path, 'wb') as fp:
+        for window in range(len(bounds['testEnds'])):
+            data_helper.write_json_lines(fp, deepar.test_records(values, offsets, bounds, window))
+    logger.info(f"Test data generated. Test data length={num_timeseries * len(bounds['testEnds'])}")
+    logger.info(f"Test data generated in JSON set as 'test' in ProcessingOutput at {test_data_file_path}")
+
+    ## upload to S3
+
+    s3Client.uploadToModels(exec_id, 'data/train/train.json', training_data_file_path)
+    logger.info(f"Training data generated in JSON line format and uploaded to {config.modelsBucketName}/{exec_id}/data/train/train.json")
+    s3Client.uploadToModels(exec_id, 'data/test/test.json', test_data_file_path)
+    logger.info(f"Test data generated in JSON line format and uploaded to {config.modelsBucketName}/{exec_id}/data/test/test.json")
+
+    export_evaluation_input(output_paths, deepARMeta, s3Client, exec_id)
+
+# :: copy the outputs of a previous execution with the same input fingerprint instead of recomputing them
+def reuse_previous_execution(previous, exec_id, deepARMeta, s3Client, ddbClient, per_execution_dirs=False):
+    prev_id = previous['Id']
+
+    output_paths = get_output_paths(exec_id, per_execution_dirs)
+    for bucket_key, local_file in output_paths.items():
+        if bucket_key == 'data/evaluation/input.json':
+            continue
+        if not s3Client.downloadFromModels(prev_id, bucket_key, local_file):
+            raise Exception(f"Output '{bucket_key}' of execution {prev_id} not found")
+        s3Client.uploadToModels(exec_id, bucket_key, local_file)
+
+    # the evaluation input is regenerated, executions before the model evaluation don't have it
+    export_evaluation_input(output_paths, deepARMeta, s3Client, exec_id)
+
+    num_plots = s3Client.copyModelsPrefix(prev_id, exec_id, 'plots/')
+
+    feature_importance_item = ddbClient.getFeatureImportance(prev_id)
+    if feature_importance_item is not None:
+        ddbClient.saveFeatureImportance(exec_id, feature_importance_item['data'])
+        if 'pruning' in feature_importance_item:
+            ddbClient.saveFeaturePruning(exec_id, feature_importance_item['pruning'])
+
+    logger.info(f"Outputs of execution {prev_id} reused (features, train/test datasets, {num_plots} plots, feature importance)")
+
+# ---
+# ## OUT-OF-CORE MODE
+# The columns are kept in a disk-backed SharedFeatureMatrix and every stage works on a chunk of
+# columns (or rows) at a time, so the peak memory is bounded by `config.memoryBudgetMB` instead of
+# the size of the universe.
+
+# :: number of columns (or rows) per chunk that fit the memory budget
+# `bytes_per_item` is the working memory of one column/row, including the temporaries of the stage
+def _chunk_size(bytes_per_item):
+    return max(1, int(config.memoryBudgetMB * 1024 * 1024 // max(bytes_per_item, 1)))
+
+# :: names of all the columns of the feature matrix, in the order the in-memory stages add them
+def get_feature_columns(tickers, taSettings, arimaSettings, fftSettings, assets_for_fft, cross_columns):
+    columns = list(tickers)
+    if taSettings['enabled']:
+        for asset_id in taSettings['assets']:
+            columns += [SEPARATOR.join([str(asset_id), *suffix]) for suffix in [['BB', 'Up'], ['BB', 'Low'], ['BB', 'MA'], ['RSI'], ['SMA']]]
+    if arimaSettings['enabled']:
+        columns += [SEPARATOR.join([str(asset_id), 'ARIMA']) for asset_id in arimaSettings['assets']]
+    if fftSettings['enabled']:
+        for asset_id in assets_for_fft:
+            columns += [SEPARATOR.join([str(asset_id), 'FT', str(int(num))]) for num in fftSettings['num_steps']]
+    columns += cross_columns
+
+    return list(dict.fromkeys(columns))
+
+# :: inner join of the asset CSVs on Date, written column by column into a disk-backed matrix
+# with a coarser template frequency only the last trading day of every period is written
+def load_asset_data_out_of_core(assets_to_load_tickers, columns, path, frames=None, freq='1D'):
+    def read(asset_ticker):
+        return frames[asset_ticker] if frames is not None and asset_ticker in frames else read_asset_csv(asset_ticker)
+
+    # only the Date columns are held to find the common trading days (in the order of the first asset)
+    dates = None
+    for asset_ticker in assets_to_load_tickers:
+        asset_dates = read(asset_ticker)['Date'].to_numpy()
+        dates = asset_dates if dates is None else dates[np.isin(dates, asset_dates)]
+
+    row_dates = dates
+    if not resample.is_daily(freq):
+        dates, last_rows = resample.period_ends(row_dates, freq)
+        row_dates = row_dates[last_rows]
+        logger.info(f"Prices resampled to the template frequency {freq}: {len(last_rows)} periods")
+
+    matrix = SharedFeatureMatrix(len(dates), columns, path=path)
+    for asset_ticker in assets_to_load_tickers:
+        df = read(asset_ticker)
+        matrix.set_column(asset_ticker, df[asset_ticker].to_numpy(dtype='float64')[pd.Index(df['Date']).get_indexer(row_dates)])
+    matrix.flush()
+
+    return dates, matrix
+
+# :: TA, ARIMA and FFT features of chunks of assets, written into the matrix
+def add_asset_features_out_of_core(matrix, dates, tickers, taSettings, arimaSettings, fftSettings, assets_for_fft, workers=1):
+    # a price column and its features, plus the temporaries of the indicators
+    chunk_size = _chunk_size(matrix.shape[0] * 8 * 64)
+
+    for start in range(0, len(tickers), chunk_size):
+        chunk = tickers[start:start + chunk_size]
+        in_chunk = set(chunk)
+
+        chunkDF = pd.DataFrame({ 'Date': dates, **{ asset_id: matrix.column(asset_id) for asset_id in chunk } })
+        chunkDF = add_ta_features(chunkDF, { **taSettings, 'assets': [a for a in taSettings['assets'] if a in in_chunk] })
+        chunkDF = add_arima_features(chunkDF, { **arimaSettings, 'assets': [a for a in arimaSettings['assets'] if a in in_chunk] }, workers=workers)
+        chunkDF = add_fft_features(chunkDF, fftSettings, [a for a in assets_for_fft if a in in_chunk], None, None, None, plot=False)
+
+        for col in chunkDF.columns[1 + len(chunk):]:
+            matrix.set_column(col, chunkDF[col].to_numpy(dtype='float64'))
+        matrix.flush()
+
+        logger.debug(f"Features of assets {start + 1}-{start + len(chunk)} of {len(tickers)} written to the feature store")
+
+# :: cross-asset features of chunks of assets, the class sums are accumulated in a first pass
+def add_cross_asset_features_out_of_core(matrix, crossAssetSettings, assets_for_cross, asset_classes, predicted_asset):
+    window = int(crossAssetSettings['window'])
+    # returns, their rolling moment sums and the outputs
+    chunk_size = _chunk_size(matrix.shape[0] * 8 * 16)
+    index = pd.RangeIndex(matrix.shape[0])
+
+    def chunk_returns(start):
+        return cross_asset.daily_returns(matrix.to_frame(columns=assets_for_cross[start:start + chunk_size]).to_numpy(dtype='float64'))
+
+    target_returns = None
+    if crossAssetSettings.get('againstPredicted', True):
+        target_returns = cross_asset.daily_returns(matrix.column(predicted_asset))
+
+    class_sums, class_sizes = None, None
+    if crossAssetSettings.get('againstAssetClass', True):
+        class_sums, class_sizes = {}, {}
+        for start in range(0, len(assets_for_cross), chunk_size):
+            sums, sizes = cross_asset.class_return_sums(chunk_returns(start), asset_classes[start:start + chunk_size])
+            for c in sums:
+                class_sums[c] = class_sums[c] + sums[c] if c in class_sums else sums[c]
+                class_sizes[c] = class_sizes.get(c, 0) + sizes[c]
+
+    for start in range(0, len(assets_for_cross), chunk_size):
+        predicted_features, class_features = cross_asset.cross_asset_block(
+            chunk_returns(start),
+            assets_for_cross[start:start + chunk_size],
+            asset_classes[start:start + chunk_size],
+            window,
+            predicted_asset,
+            target_returns,
+            class_sums,
+            class_sizes
+        )
+        for col, values in cross_asset.fill_leading_nans({ **predicted_features, **class_features }, index).items():
+            matrix.set_column(col, values.to_numpy())
+        matrix.flush()
+
+    logger.info(f"Generated rolling correlation/beta features (window={window}) for {len(assets_for_cross)} assets")
+
+# :: autoencoder trained on mini-batches of rows read from the matrix; its outputs are written into `output_columns`
+def add_autoencoder_features_out_of_core(matrix, input_columns, output_columns, autoEncoderSettings, s3Client, exec_id, outputTmpDir):
+    from tensorflow.keras.utils import Sequence
+
+    input_idx = [matrix.column_index[c] for c in input_columns]
+    output_idx = [matrix.column_index[c] for c in output_columns]
+    batch_size = int(autoEncoderSettings['fitBatchSize'])
+
+    class RowBatches(Sequence):
+        def __init__(self, start, stop):
+            self.start = start
+            self.stop = stop
+
+        def __len__(self):
+            return int(np.ceil((self.stop - self.start) / batch_size))
+
+        def __getitem__(self, i):
+            rows = slice(self.start + i * batch_size, min(self.start + (i + 1) * batch_size, self.stop))
+            X = matrix.values[rows, input_idx]
+            return X, X
+
+    # same split as data_helper.get_train_test_split
+    num_rows = matrix.shape[0]
+    train_samples = int(num_rows * 0.7) + 1
+
+    autoencoder = build_autoencoder(len(input_columns), autoEncoderSettings)
+
+    history = autoencoder.fit(
+        RowBatches(0, train_samples),
+        epochs=int(autoEncoderSettings['fitEpoch']),
+        shuffle=bool(autoEncoderSettings['fitShuffle']),
+        validation_data=RowBatches(train_samples, num_rows),
+        verbose=int(config.autoEncoderVerbose) # 0=silent
+    )
+
+    logger.info(f"Autoencoder ran successfully [{history}]")
+
+    plot_autoencoder_loss(history, s3Client, exec_id, outputTmpDir)
+
+    # inputs, outputs and the activations of a row
+    rows_per_chunk = _chunk_size((len(input_columns) + len(output_columns) + 1860) * 8)
+    for start in range(0, num_rows, rows_per_chunk):
+        rows = slice(start, min(start + rows_per_chunk, num_rows))
+        matrix.values[rows, output_idx] = autoencoder.predict(matrix.values[rows, input_idx], batch_size=batch_size)
+    matrix.flush()
+
+    logger.info(f'Number of synthetic features (AE): {len(output_columns)}.')
+
+# :: write features.csv and the DeepAR datasets from the matrix, streaming chunks of rows/columns to the files
+def export_deepar_datasets_out_of_core(matrix, dates, float32_columns, deepARMeta, s3Client, exec_id, per_execution_dirs=False):
+    output_paths = get_output_paths(exec_id, per_execution_dirs)
+    num_rows, num_columns = matrix.shape
+
+    # :: features.csv in chunks of rows
+    features_local_file = output_paths['training/features.csv']
+    rows_per_chunk = _chunk_size(num_columns * 8 * 4)
+    for start in range(0, num_rows, rows_per_chunk):
+        stop = min(start + rows_per_chunk, num_rows)
+        index = pd.RangeIndex(start, stop)
+        chunkDF = pd.DataFrame(matrix.values[start:stop], columns=matrix.columns, index=index)
+        chunkDF = pd.concat([
+            pd.Series(dates[start:stop], index=index, name='Date'),
+            chunkDF.drop(columns=float32_columns),
+            chunkDF[float32_columns].astype('float32'),
+        ], axis='columns')[['Date'] + matrix.columns]
+        chunkDF.to_csv(features_local_file, mode='w' if start == 0 else 'a', header=start == 0)
+    s3Client.uploadFeatureCsv(exec_id, features_local_file)
+    logger.info(f'Features CSV uploaded to {config.modelsBucketName}/{exec_id}/training/features.csv')
+
+    # :: one series per column, the test windows are written to separate files and concatenated
+    bounds = deepar.get_bounds(dates, deepARMeta)
+    training_data_file_path = output_paths['data/train/train.json']
+    test_data_file_path = output_paths['data/test/test.json']
+    test_window_paths = [f"{test_data_file_path}.{k}" for k in range(len(bounds['testEnds']))]
+
+    columns_per_chunk = _chunk_size(num_rows * 8 * 4)
+    train_fp = open(training_data_file_path, 'wb')
+    test_fps = [open(path, 'wb') for path in test_window_paths]
+    try:
+        for start in range(0, num_columns, columns_per_chunk):
+            values = matrix.values[:, start:start + columns_per_chunk]
+            offsets = deepar.series_offsets(values, bounds['startOffset'])
+
+            data_helper.write_json_lines(train_fp, deepar.train_records(values, offsets, bounds))
+            for window, test_fp in enumerate(test_fps):
+                data_helper.write_json_lines(test_fp, deepar.test_records(values, offsets, bounds, window))
+    finally:
+        train_fp.close()
+        for test_fp in test_fps:
+            test_fp.close()
+
+    with open(test_data_file_path, 'wb') as fp:
+        for path in test_window_paths:
+            with open(path, 'rb') as window_fp:
+                shutil.copyfileobj(window_fp, fp)
+            os.remove(path)
+
+    logger.info(f"Training data generated in JSON set as 'train' in ProcessingOutput at {training_data_file_path} ({num_columns} series)")
+    logger.info(f"Test data generated in JSON set as 'test' in ProcessingOutput at {test_data_file_path} ({num_columns * len(bounds['testEnds'])} series)")
+
+    s3Client.uploadToModels(exec_id, 'data/train/train.json', training_data_file_path)
+    logger.info(f"Training data generated in JSON line format and uploaded to {config.modelsBucketName}/{exec_id}/data/train/train.json")
+    s3Client.uploadToModels(exec_id, 'data/test/test.json', test_data_file_path)
+    logger.info(f"Test data generated in JSON line format and uploaded to {config.modelsBucketName}/{exec_id}/data/test/test.json")
+
+    export_evaluation_input(output_paths, deepARMeta, s3Client, exec_id)
+
+# :: run a stage of run_step with the BLAS/OpenMP thread pools capped to the thread budget
+def run_stage(checkpoints, stage, inputs, fn):
+    with threads.limit(threads.budget(), stage):
+        return checkpoints.run(stage, inputs, fn)
+
+# :: export stage, timed like the other stages for the resource planner
+# it isn't checkpointed: its outputs are the processing outputs, which every job has to write again
+def run_export_stage(checkpoints, fn):
+    with threads.limit(threads.budget(), 'export'):
+        return checkpoints.run_untracked('export', fn)
+
+# :: feature engineering of one execution in the out-of-core mode, returns whether the datasets were exported
+# the stages are the same as in run_step; stage checkpoints are not written, the matrix is the only copy of the data
+def run_step_out_of_core(exec_id, template, assets, assets_to_load_tickers, s3Client, ddbClient, outputTmpDir, shared):
+    predicted_asset = template['predictedAsset']
+    feMeta = template['feMeta']
+
+    storeDir = f"{config.featureStoreDirBase}/{exec_id}"
+    if not os.path.exists(storeDir):
+        os.makedirs(storeDir)
+
+    assetDF = pd.DataFrame([val for val in assets if val['ticker'] in assets_to_load_tickers])
+    plot_asset_classes(assetDF, s3Client, exec_id, outputTmpDir)
+
+    taSettings = feMeta['taSettings']
+    arimaSettings = feMeta['arimaSettings']
+    fftSettings = feMeta['fftSettings']
+    assets_for_fft = list(assetDF[assetDF['assetClass'].isin(fftSettings['assetClasses'])]['ticker'])
+
+    crossAssetSettings = feMeta.get('crossAssetSettings', { 'enabled': False })
+    assets_for_cross, asset_classes, cross_columns = [], [], []
+    if crossAssetSettings['enabled']:
+        assets_for_cross = cross_asset.get_assets_for_cross(crossAssetSettings, assetDF, set(assets_to_load_tickers), predicted_asset)
+        classes_dict = dict(zip(assetDF['ticker'], assetDF['assetClass']))
+        asset_classes = [classes_dict.get(a) for a in assets_for_cross]
+        cross_columns = cross_asset.cross_asset_columns(assets_for_cross, asset_classes, crossAssetSettings, predicted_asset)
+
+    columns = get_feature_columns(assets_to_load_tickers, taSettings, arimaSettings, fftSettings, assets_for_fft, cross_columns)
+
+    dates, matrix = load_asset_data_out_of_core(assets_to_load_tickers, columns, f"{storeDir}/features.f64", shared.get('frames'), template['deepARMeta']['freq'])
+    logger.info(f"Feature store of {matrix.shape[0]} rows x {matrix.shape[1]} columns at {storeDir}, memory budget {config.memoryBudgetMB} MB")
+
+    try:
+        add_asset_features_out_of_core(matrix, dates, assets_to_load_tickers, taSettings, arimaSettings, fftSettings, assets_for_fft, config.parallelWorkers)
+        if fftSettings['enabled'] and len(assets_for_fft) > 0:
+            plot_fft_components(matrix.column(assets_for_fft[-1]), s3Client, exec_id, outputTmpDir)
+
+        if len(assets_for_cross) > 0:
+            add_cross_asset_features_out_of_core(matrix, crossAssetSettings, assets_for_cross, asset_classes, predicted_asset)
+
+        plot_autocorrelation(pd.Series(matrix.column(predicted_asset)), s3Client, exec_id, outputTmpDir)
+
+        feature_imp_df = feature_importance.calc_feature_importance_out_of_core(
+            matrix,
+            assetDF,
+            predicted_asset,
+            exec_id,
+            s3Client,
+            ddbClient,
+            outputTmpDir,
+            _chunk_size(matrix.shape[1] * 8 * 4),
+            storeDir
+        )
+
+        kept_columns = matrix.columns
+        pruningSettings = feMeta.get('pruningSettings', { 'enabled': False })
+        if pruningSettings['enabled']:
+            # the correlation pruning holds two blocks of columns and their correlation matrix
+            correlation_chunk = min(_chunk_size(matrix.shape[0] * 8 * 4), math.isqrt(_chunk_size(8 * 2)))
+            kept, dropped = feature_importance.select_features(matrix.to_frame(), feature_imp_df, pruningSettings, correlation_chunk)
+            ddbClient.saveFeaturePruning(exec_id, { 'settings': pruningSettings, 'kept': kept, 'dropped': dropped })
+            dropped = set(dropped)
+            kept_columns = [c for c in matrix.columns if c not in dropped]
+            logger.info(f"Feature pruning reduced the number of columns from {matrix.shape[1] + 1} to {len(kept_columns) + 1}")
+
+        # as in run_step, the datasets are only exported with the autoencoder features
+        autoEncoderSettings = feMeta['autoEncoderSettings']
+        if not autoEncoderSettings['enabled']:
+            return False
+
+        # :: the exported columns and the autoencoder outputs (named 0..n-1 as in add_autoencoder_features)
+        input_columns = [c for c in kept_columns if c != predicted_asset]
+        output_columns = list(range(len(input_columns)))
+        with SharedFeatureMatrix(matrix.shape[0], kept_columns + output_columns, path=f"{storeDir}/export.f64") as export_matrix:
+            for col in kept_columns:
+                export_matrix.set_column(col, matrix.column(col))
+            export_matrix.flush()
+            matrix.release()
+
+            add_autoencoder_features_out_of_core(export_matrix, input_columns, output_columns, autoEncoderSettings, s3Client, exec_id, outputTmpDir)
+
+            logger.info(f"Number of records (trading days): {export_matrix.shape[0]:,.0f} (between {dates[0]} and {dates[-1]}).")
+            logger.info(f'Total number of features: {export_matrix.shape[1] + 1}.')
+
+            export_deepar_datasets_out_of_core(export_matrix, dates, output_columns, template['deepARMeta'], s3Client, exec_id, shared.get('outputsPerExecution', False))
+
+        return True
+    finally:
+        if matrix.values is not None:
+            matrix.release()
+        shutil.rmtree(storeDir, ignore_errors=True)
+
+# :: record the measured profile of the run, recalibrate the planner and store the plan of the template
+# the execution launcher starts the next runs of the template with the planned instance type and volume size.
+# Before the stages (`timings` is None) the plan of the current template version only goes up, so that a run
+# killed for running out of memory leaves a plan and its failover instance type for the next one; after the
+# run the plan is recalibrated on the measured peak memory and can go down again
+def update_processing_plan(exec_id, template_id, template, assets, estimate, num_test_rows, timings, peak_memory, ddbClient):
+    try:
+        if timings:
+            ddbClient.saveProcessingProfile(exec_id, resource_planner.profile(estimate, timings, peak_memory))
+
+        template_updated_at = template.get('updatedAt', 0)
+        previous_plan = template.get('processingPlan')
+        min_instance_type = None
+        if timings is None and previous_plan is not None and previous_plan.get('templateUpdatedAt') == template_updated_at:
+            min_instance_type = previous_plan['instanceType']
+
+        coefficients = resource_planner.calibrate(ddbClient.listProcessingProfiles(config.plannerMaxProfiles))
+        plan = resource_planner.plan(template, assets, estimate['rows'], num_test_rows, coefficients, min_instance_type, resource_planner.current_instance_type(), finished=timings is not None)
+        ddbClient.saveProcessingPlan(template_id, plan, coefficients, template_updated_at)
+
+        logger.info(f"Processing plan of template {template_id}: {plan['instanceType']}, {plan['volumeSizeInGB']} GB volume (calibrated on {coefficients['samples']} runs)")
+    except Exception as err:
+        # the plan only sizes the next runs, never fail the execution because of it
+        logger.warning(f"Processing plan not updated: {str(err)}")
+
+# :: run the feature engineering step for one execution
+# `shared` is set by run_batch and holds the clients, asset list, loaded CSVs and computed features of the batch
+def run_step(exec_id, resume=False, shared=None, force=False):
     if not exec_id:
         raise Exception('exec_id parameter not set. Quitting...')
 
-    ddbClient = DDBClient()
-    s3Client = S3Client()
+    started = time.time()
+    # stage timings and peak memory of batch runs include the other executions, they aren't profiled
+    profiled = shared is None
+
+    if shared is None:
+        shared = {}
+        prepare_tmp_dirs()
+        ddbClient = DDBClient()
+        s3Client = S3Client()
+    else:
+        ddbClient = shared['ddbClient']
+        s3Client = shared['s3Client']
+        # every execution item gets its own logs
+        logger.clear()
 
     # :: -
     logger.info(f"Model training execution started. exec_id={exec_id}")
@@ -55,187 +803,123 @@ def run_step(exec_id):
         # 2. Fetch the training template
 
         # :: get the assets list
-        assets = ddbClient.listAssets()
+        assets = shared['assets'] if 'assets' in shared else ddbClient.listAssets()
         logger.info(f"{len(assets)} assets loaded from DB")
 
         # :: fetch execution instance and training template
         execution_instance = ddbClient.getTrainingExecutionItem(exec_id)
-        template = ddbClient.getTrainingTemplate(execution_instance['templateId'])
+        template = shared['templates'][exec_id] if 'templates' in shared else ddbClient.getTrainingTemplate(execution_instance['templateId'])
 
         logger.info(f"Execution instance loaded (exec_id: {exec_id}), template loaded (template_id: {execution_instance['templateId']})")
 
-        predicted_asset = template['predictedAsset']
-        base_assets_ddb = template['feMeta']['baseAssets']
-        
-        assets_to_load_tickers = []
+        # :: stage checkpoints, resumed stages are skipped when their input fingerprint is unchanged
+        # a retried or relaunched processing job starts on a new volume, only the uploaded checkpoints can be restored there
+        upload_checkpoints = config.uploadCheckpoints or (resume and config.inProcessingJob)
+        checkpoints = CheckpointStore(
+            exec_id,
+            s3Client,
+            ddbClient,
+            resume=resume,
+            upload=upload_checkpoints,
+            completed=execution_instance.get('processingStepCheckpoints')
+        )
+        if resume:
+            logger.info(f"Resuming execution, completed stages: {list(checkpoints.completed.keys())}")
 
-        if base_assets_ddb == 'all':
-            assets_to_load_tickers = list(map(lambda x: x['ticker'], assets))
-        else:
-            tmp_all_assetsDF = pd.DataFrame(assets)
-            tmp_assets_for_fft = list(tmp_all_assetsDF[tmp_all_assetsDF['assetClass'].isin(template['feMeta']['fftSettings']['assetClasses'])]['ticker'])
-            base_assets_tickers = base_assets_ddb
-            assets_to_load_tickers = list(np.unique(base_assets_tickers + template['feMeta']['taSettings']['assets'] + template['feMeta']['arimaSettings']['assets'] + tmp_assets_for_fft))
+        predicted_asset = template['predictedAsset']
+        assets_to_load_tickers = data_helper.get_assets_to_load(template, assets)
 
         logger.info(f"{len(assets_to_load_tickers)} assets set as base assets")
 
         # ---
         # 3. Merge all assets into one dataframe
         # :: load the CSVs with pandas
-        mainDF = None
-
-        assets_not_exist = []
-        for asset_ticker in assets_to_load_tickers:
-            asset_file = f"{config.ASSETS_DIR}/{asset_ticker}.csv"
-            if not os.path.exists(asset_file):
-                assets_not_exist.append(asset_ticker)
-                continue
-
-            df = pd.read_csv(asset_file)
-            df.columns = ['Date', asset_ticker]
-            
-            if mainDF is None:
-                mainDF = df
-                continue
-
-            mainDF = mainDF.merge(df, how='inner', on='Date')
-
-        for to_remove in assets_not_exist:
-            assets_to_load_tickers.remove(to_remove)
+        assets_to_load_tickers = [t for t in assets_to_load_tickers if os.path.exists(f"{config.ASSETS_DIR}/{t}.csv")]
+        digests = shared.get('digests', {})
+        asset_digests = { t: digests[t] if t in digests else file_digest(f"{config.ASSETS_DIR}/{t}.csv") for t in assets_to_load_tickers }
+
+        # :: identical template and asset data as a finished execution -> reuse its outputs
+        input_fp = fingerprint(FEATURE_VERSION, predicted_asset, template['feMeta'], template['deepARMeta'], asset_digests)
+        previous = None if force else ddbClient.findExecutionByFingerprint(input_fp, exclude_id=exec_id)
+
+        if previous is not None:
+            try:
+                reuse_previous_execution(previous, exec_id, template['deepARMeta'], s3Client, ddbClient, shared.get('outputsPerExecution', False))
+            except Exception as err:
+                # e.g. the outputs of the matched execution were deleted or only partially written
+                logger.warning(f"Outputs of execution {previous['Id']} can't be reused ({str(err)}), computing the features")
+                previous = None
+
+        if previous is not None:
+            duration = round(time.time() - started)
+            # the matched execution can be a reuse itself, its duration is then only the copy time
+            compute_duration = int(previous.get('processingStepComputeDuration', previous.get('processingStepDuration', 0)))
+            logger.info(f"Feature engineering skipped, input fingerprint matches execution {previous['Id']} (saved ~{compute_duration - duration}s)")
+
+            ddbClient.updateExecItemStatus(exec_id, 'FINISHED', logger.get_logs(), stage='reused')
+            ddbClient.saveInputFingerprint(exec_id, input_fp, duration, compute_duration)
+            return
+
+        # :: out-of-core mode, for universes whose features don't fit in memory
+        if config.outOfCore:
+            if resume:
+                logger.warning("Stage checkpoints are not used in the out-of-core mode, all stages are recomputed")
+            with threads.limit(threads.budget(), 'out_of_core'):
+                exported = run_step_out_of_core(exec_id, template, assets, assets_to_load_tickers, s3Client, ddbClient, outputTmpDir, shared)
+            if exported:
+                ddbClient.updateExecItemStatus(exec_id, 'FINISHED', logger.get_logs(), stage='export')
+                ddbClient.saveInputFingerprint(exec_id, input_fp, round(time.time() - started))
+            return
+
+        freq = template['deepARMeta']['freq']
+        # batch feature cache of the template frequency, the row keys of _feature_key are the period labels
+        feature_cache = shared['features'].setdefault(resample.get_rule(freq), {}) if 'features' in shared else None
+        mainDF = run_stage(checkpoints, 'load', [FEATURE_VERSION, asset_digests, resample.get_rule(freq)], lambda: load_asset_data(assets_to_load_tickers, shared.get('frames'), freq))
+
+        # :: resource estimate with the coefficients calibrated on the previous runs
+        end_training = pd.Timestamp(int(template['deepARMeta']['endTraining']), unit='ms')
+        num_test_rows = int((pd.to_datetime(mainDF['Date']) >= end_training).sum())
+        coefficients = json.loads(template['processingPlan']['coefficients']) if 'processingPlan' in template else None
+        estimate = resource_planner.estimate(template, assets, mainDF.shape[0], num_test_rows, coefficients)
+        logger.info(f"Estimated {estimate['featureColumns']} feature columns, {estimate['peakMemory'] / resource_planner.GiB:.1f} GiB peak memory and {estimate['runtime']:.0f}s runtime")
+
+        available_memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        if estimate['peakMemory'] > available_memory * resource_planner.MEMORY_HEADROOM:
+            logger.warning(f"Estimated peak memory exceeds the memory of the instance ({available_memory / resource_planner.GiB:.1f} GiB), the step may run out of memory")
+
+        update_processing_plan(exec_id, execution_instance['templateId'], template, assets, estimate, num_test_rows, None, None, ddbClient)
 
         # ---
         # :: stats
         assetClassStatAssets = [val for val in assets if val['ticker'] in assets_to_load_tickers]
         assetDF = pd.DataFrame(assetClassStatAssets)
-        pd.DataFrame(assetDF.groupby('assetClass')['assetClass'].count()).rename(columns={'assetClass' : 'Count'}).reset_index().sort_values(by='Count', ascending=True).plot(kind='barh', x='assetClass', y='Count', figsize=(12, 7))
-        data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'assets-per-class.png')
+        plot_asset_classes(assetDF, s3Client, exec_id, outputTmpDir)
 
         # ---
         # ### TECHNICAL ANALYSIS FEATURES
-
-        # :: get the config
         taSettings = template['feMeta']['taSettings']
-        assets_for_ta = taSettings['assets']
-        logger.debug(f'Number of assets for technical indicators: {len(assets_for_ta)}.')
-
-        # :: TA vars
-        bb_window = int(taSettings['bollingerBand']['window'])
-        bb_window_dev = int(taSettings['bollingerBand']['window_dev'])
-        rsi_window = int(taSettings['rsi']['window'])
-        sma_window = int(taSettings['sma']['window'])
-        logger.debug(f"bb_window={bb_window} | bb_window_dev={bb_window_dev} | rsi_window={rsi_window} | sma_window={sma_window}")
-
-        if taSettings['enabled']:
-
-            from ta.volatility import BollingerBands
-            from ta.momentum import RSIIndicator
-            from ta.trend import SMAIndicator, EMAIndicator
-
-            for asset_id in assets_for_ta:
-                indicator_bb = BollingerBands(close=mainDF[asset_id], window=bb_window, window_dev=bb_window_dev)
-
-                upCol = SEPARATOR.join([str(asset_id), 'BB', 'Up'])
-                lowCol = SEPARATOR.join([str(asset_id), 'BB', 'Low'])
-                maCol = SEPARATOR.join([str(asset_id), 'BB', 'MA'])
-                rsiCol = SEPARATOR.join([str(asset_id), 'RSI'])
-                smaCol = SEPARATOR.join([str(asset_id), 'SMA'])
-                
-                mainDF[upCol] = indicator_bb.bollinger_hband()
-                mainDF[lowCol] = indicator_bb.bollinger_lband()
-                mainDF[maCol] = indicator_bb.bollinger_mavg()
-                
-                rsa_indicator = RSIIndicator(close=mainDF[asset_id], window=rsi_window)
-                mainDF[rsiCol] = rsa_indicator.rsi()
-
-                sma_indicator = SMAIndicator(close=mainDF[asset_id], window=sma_window)
-                mainDF[smaCol] = sma_indicator.sma_indicator()
-                
-                # clear NaNs from the beginning of the columns
-                mainDF[[upCol, lowCol, maCol, rsiCol, smaCol]] = mainDF[[upCol, lowCol, maCol, rsiCol, smaCol]].fillna(axis='index', method='backfill')
-            
-            logger.info(f"Generated BB Up/Low/MA, RSI and SMA indicators for {len(assets_for_ta)} assets")
-            ddbClient.updateExecItemStatus(exec_id, 'RUNNING', logger.get_logs())
+        mainDF = run_stage(checkpoints, 'ta', taSettings, lambda: add_ta_features(mainDF, taSettings, feature_cache))
 
         # ---
         # ### ARIMA FEATURES
-
-        # :: get the config
         arimaSettings = template['feMeta']['arimaSettings']
-        assets_for_arima = arimaSettings['assets']
-        logger.debug(f'Number of assets for ARIMA: {len(assets_for_arima)}.')
-
-        if arimaSettings['enabled']:
-
-            from statsmodels.tsa.arima.model import ARIMA
-            from sklearn.metrics import mean_squared_error
-
-            for asset_id in assets_for_arima:
-
-                X = mainDF[asset_id]
-                size = int(len(X) * arimaSettings['trainSetSize'])
-                train, test = X[0:size], X[size:len(X)]
-                history = [x for x in train]
-                predictions = list()
-                model = ARIMA(history, order=(5,1,0))
-        #         model_fit = model.fit(disp=0)
-                model_fit = model.fit()
-                for t in range(len(test)):
-                    output = model_fit.forecast()
-                    yhat = output[0]
-                    predictions.append(yhat)
-                    obs = list(test)[t]
-                    history.append(obs)
-                arimaColName = SEPARATOR.join([str(asset_id), 'ARIMA'])
-                mainDF[arimaColName] = history
-            
-            logger.info(f"Generated ARIMA feature for {len(assets_for_arima)} assets")
-            ddbClient.updateExecItemStatus(exec_id, 'RUNNING', logger.get_logs())
+        mainDF = run_stage(checkpoints, 'arima', arimaSettings, lambda: add_arima_features(mainDF, arimaSettings, feature_cache, config.parallelWorkers))
 
         # ---
         # ### FFT FEATURES
-
         fftSettings = template['feMeta']['fftSettings']
-        asset_classes_for_fft = fftSettings['assetClasses']
-        assets_for_fft = list(assetDF[assetDF['assetClass'].isin(asset_classes_for_fft)]['ticker'])
-        logger.debug(f'Number of assets for Fourier transforms: {len(assets_for_fft)}.')
-
-        if (fftSettings['enabled']):
-            fft_num_comp = int(fftSettings['num_comp'])
-
-            for asset_id in assets_for_fft:
-                # discrete Fourier transformation
-                close_fft = np.fft.fft(mainDF[asset_id])
-                fft_df = pd.DataFrame({ 'fft': close_fft })
-                # get abs and angle (both float64 output)
-                fft_df['absolute'] = fft_df['fft'].apply(lambda x: np.abs(x))
-                fft_df['angle'] = fft_df['fft'].apply(lambda x: np.angle(x))
-
-                fft_list = np.asarray(fft_df['fft'].tolist())
-                for num_ in fftSettings['num_steps']:
-                    num = int(num_)
-                    fft_list_m10 = np.copy(fft_list)
-                    fft_list_m10[num:-num] = 0
-                    
-                    fftColName = SEPARATOR.join([str(asset_id), 'FT', str(num)])
-                    mainDF[fftColName] = np.fft.ifft(fft_list_m10).real
-                    
-            logger.info(f"Generated {len(fftSettings['num_steps'])} FFT step features for {len(assets_for_fft)} assets")
-            ddbClient.updateExecItemStatus(exec_id, 'RUNNING', logger.get_logs())
-
-        # --- plot FFT components
-        from collections import deque
-        items = deque(np.asarray(fft_df['absolute'].tolist()))
-        items.rotate(int(np.floor(len(fft_df)/2)))
-        plt.figure(figsize=(15, 10), dpi=80)
-        plt.stem(items)
-        plt.title('Components of Fourier transforms')
-        data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'fft-components.png')
+        assets_for_fft = list(assetDF[assetDF['assetClass'].isin(fftSettings['assetClasses'])]['ticker'])
+        mainDF = run_stage(checkpoints, 'fft', [fftSettings, assets_for_fft], lambda: add_fft_features(mainDF, fftSettings, assets_for_fft, s3Client, exec_id, outputTmpDir, feature_cache))
+
+        # ---
+        # ### CROSS-ASSET FEATURES
+        crossAssetSettings = template['feMeta'].get('crossAssetSettings', { 'enabled': False })
+
+        if crossAssetSettings['enabled']:
+            mainDF = run_stage(checkpoints, 'cross_asset', [crossAssetSettings, predicted_asset], lambda: cross_asset.add_cross_asset_features(mainDF, crossAssetSettings, assetDF, predicted_asset))
 
         # --- plot autocorrelation
-        plt.figure(figsize=(8, 7), dpi=120)
-        from pandas.plotting import autocorrelation_plot
-        autocorrelation_plot(mainDF[predicted_asset])
-        data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'autocorrelation.png')
+        plot_autocorrelation(mainDF[predicted_asset], s3Client, exec_id, outputTmpDir)
 
         # ---
         # ### AUTOENCODERS FEATURES
@@ -243,7 +927,7 @@ def run_step(exec_id):
 
         # ---
         # Calculate feature importance
-        feature_importance.calc_feature_importance(
+        feature_imp_df = run_stage(checkpoints, 'feature_importance', predicted_asset, lambda: feature_importance.calc_feature_importance(
             mainDF,
             assetDF,
             predicted_asset,
@@ -251,144 +935,103 @@ def run_step(exec_id):
             s3Client,
             ddbClient,
             outputTmpDir
-        )
+        ))
+
+        # ---
+        # ### FEATURE PRUNING
+        # drop low-importance columns before the autoencoder and the DeepAR datasets
+        pruningSettings = template['feMeta'].get('pruningSettings', { 'enabled': False })
+
+        if pruningSettings['enabled']:
+            num_columns = mainDF.shape[1]
+            mainDF = run_stage(checkpoints, 'pruning', pruningSettings, lambda: feature_importance.prune_features(mainDF, feature_imp_df, pruningSettings, exec_id, ddbClient))
+            logger.info(f"Feature pruning reduced the number of columns from {num_columns} to {mainDF.shape[1]}")
 
         # :: get config
         autoEncoderSettings = template['feMeta']['autoEncoderSettings']
 
         if (autoEncoderSettings['enabled']):
-            
-            (X_train, y_train), (X_test, y_test) = data_helper.get_train_test_split(mainDF.copy(deep=True), predicted_asset)
-            
-            logger.debug(f"mainDF dim: {len(list(mainDF.columns))}")
-            logger.debug(f"training set dim: {len(list(X_train.columns))}")
-            logger.debug(f"testing set dim: {len(list(X_test.columns))}")
-            
-            from tensorflow.keras.layers import Dense
-            from tensorflow.keras.models import Sequential
-            
-            autoencoder = Sequential()
-            
-            x_dim = len(list(X_train.columns))
-            autoencoder.add(Dense(600, activation='sigmoid', input_dim=x_dim))
-            autoencoder.add(Dense(330, activation='relu', input_dim=600))
-            autoencoder.add(Dense(x_dim, activation='relu', input_dim=330))
-            autoencoder.add(Dense(330, activation='relu', input_dim=x_dim))
-            autoencoder.add(Dense(600, activation='relu', input_dim=330))
-            autoencoder.add(Dense(x_dim, activation='sigmoid', input_dim=600))
-            
-            autoencoder.compile(optimizer=autoEncoderSettings['optimizer'], loss=autoEncoderSettings['loss'])
-            autoencoder.summary()
-            
-            history = autoencoder.fit(
-                x=X_train,
-                y=X_train,
-                epochs=int(autoEncoderSettings['fitEpoch']),
-                batch_size=int(autoEncoderSettings['fitBatchSize']),
-                shuffle=bool(autoEncoderSettings['fitShuffle']),
-                validation_data=(X_test, X_test),
-                verbose=int(config.autoEncoderVerbose) # 0=silent
-            )
-
-            logger.info(f"Autoencoder ran successfully [{history}]")
-            ddbClient.updateExecItemStatus(exec_id, 'RUNNING', logger.get_logs())
-
-            # -- plot loss
-            plt.plot(history.history['val_loss'], label='val_loss')
-            # plt.plot(history.history['loss'], label='loss')
-            plt.legend()
-            plt.title('Validation loss of Autoencoders')
-            plt.xlabel('Epoch')
-            data_helper.save_and_upload_plot(plt, s3Client, exec_id, outputTmpDir, 'validation-loss-autoencoder.png')
 
-            autoencoder_predictions = autoencoder.predict(mainDF.drop(['Date', predicted_asset], axis='columns', inplace=False).values)
-
-            assert mainDF.shape[0] == autoencoder_predictions.shape[0], 'Something is wrong with merging data autoencoder features with the other features'
-
-            autoencoder_predictions_df = pd.DataFrame(autoencoder_predictions)
-            autoencoder_predictions_df['Date'] = mainDF['Date']
-            featuresDF = mainDF.merge(autoencoder_predictions_df, left_on='Date', right_on='Date')
-            # featuresDF.drop('Date',axis=1, inplace=True) # I DON'T SEE WHY WE NEED TO DO THIS
+            featuresDF = run_stage(checkpoints, 'autoencoder', [predicted_asset, autoEncoderSettings], lambda: add_autoencoder_features(mainDF, predicted_asset, autoEncoderSettings, s3Client, exec_id, outputTmpDir))
 
             logger.info(f"Number of records (trading days): {featuresDF.shape[0]:,.0f} (between {list(mainDF.head(1)['Date'])[0]} and {list(mainDF.tail(1)['Date'])[0]}).")
             logger.debug(f'Number of assets used: {len(assets_to_load_tickers)}.')
             logger.info(f'Number of technical features on assets: {mainDF.shape[1] - len(assets_to_load_tickers) - 1}.')
-            logger.info(f'Number of synthetic features (AE): {autoencoder_predictions_df.shape[1] - 1}.')
             logger.info(f'Total number of features: {featuresDF.shape[1]}.')
 
-            # features_local_file = f"{config.featuresTmpDir}/{exec_id}-features.csv"
-            features_local_file = f"{config.baseDir}/features/features.csv"
-            featuresDF.to_csv(features_local_file)
-            s3Client.uploadFeatureCsv(exec_id, features_local_file)
-            logger.info(f'Features CSV uploaded to {config.modelsBucketName}/{exec_id}/training/features.csv')
-
-            featuresDF.set_index('Date', inplace=True)
-
-            num_timeseries = featuresDF.shape[1]
-            timeseries = []
-            for i in range(num_timeseries):
-                timeseries.append(np.trim_zeros(featuresDF.iloc[:, i], trim="f"))
-
-            deepARMeta = template['deepARMeta']
-
-            DATEFORMAT = '%Y-%m-%d'
-            start_ds_ts = int(deepARMeta['startDataset'])/1000
-            start_ds_date = datetime.utcfromtimestamp(start_ds_ts).strftime(DATEFORMAT)
-
-            end_ts = int(deepARMeta['endTraining'])/1000
-            end_date = datetime.utcfromtimestamp(end_ts).strftime(DATEFORMAT)
-
-            freq = deepARMeta['freq'] # 1D
-
-            start_dataset = pd.Timestamp(start_ds_date, freq=freq)
-            end_training = pd.Timestamp(end_date, freq=freq)
-            day_delta = pd.Timedelta(days=1)
-
-            training_data = [
-                {
-                    "start": str(start_dataset),
-                    "target": ts[str(start_dataset) : str(end_training - day_delta)].tolist(),
-                    # We use -day_delta, because pandas indexing includes the upper bound
-                }
-                for ts in timeseries
-            ]
-            logger.info(f"Training data generated. Data length={len(training_data)}")
-
-            num_test_windows = int(deepARMeta['testWindows'])
-            prediction_length = int(deepARMeta['predictionLength'])
-
-            test_data = [
-                {
-                    "start": str(start_dataset),
-                    # TODO: sliding window instead of expanding window?
-                    # "target": ts[str(start_dataset  + pd.Timedelta(days=k * prediction_length)) : str(end_training + pd.Timedelta(days=k * prediction_length))].tolist(),
-                    "target": ts[str(start_dataset) : str(end_training + pd.Timedelta(days=k * prediction_length))].tolist(),
-                }
-                for k in range(1, num_test_windows + 1)
-                for ts in timeseries
-            ]
-            logger.info(f"Test data generated. Test data length={len(test_data)}")
-
-            # training_data_file_path = f"{config.featuresTmpDir}/train-{exec_id}.json"
-            # test_data_file_path = f"{config.featuresTmpDir}/test-{exec_id}.json"
-            training_data_file_path = f"{config.baseDir}/train/train.json"
-            test_data_file_path = f"{config.baseDir}/test/test.json"
-
-            data_helper.write_dicts_to_file(training_data_file_path, training_data)
-            logger.info(f"Training data generated in JSON set as 'train' in ProcessingOutput at {training_data_file_path}")
-            data_helper.write_dicts_to_file(test_data_file_path, test_data)
-            logger.info(f"Test data generated in JSON set as 'test' in ProcessingOutput at {training_data_file_path}")
-
-            ## upload to S3
-
-            s3Client.uploadToModels(exec_id, 'data/train/train.json', training_data_file_path)
-            logger.info(f"Training data generated in JSON line format and uploaded to {config.modelsBucketName}/{exec_id}/data/train/train.json")
-            s3Client.uploadToModels(exec_id, 'data/test/test.json', test_data_file_path)
-            logger.info(f"Test data generated in JSON line format and uploaded to {config.modelsBucketName}/{exec_id}/data/test/test.json")
-
-            ddbClient.updateExecItemStatus(exec_id, 'FINISHED', logger.get_logs())
+            run_export_stage(checkpoints, lambda: export_deepar_datasets(featuresDF, template['deepARMeta'], s3Client, exec_id, shared.get('outputsPerExecution', False)))
+
+            ddbClient.updateExecItemStatus(exec_id, 'FINISHED', logger.get_logs(), stage='export', checkpoints=checkpoints.completed)
+            ddbClient.saveInputFingerprint(exec_id, input_fp, round(time.time() - started))
+            checkpoints.cleanup()
+
+            # ru_maxrss is in KiB on Linux; the process pool workers are counted by RUSAGE_CHILDREN
+            peak_memory = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+            update_processing_plan(
+                exec_id,
+                execution_instance['templateId'],
+                template,
+                assets,
+                estimate,
+                num_test_rows,
+                checkpoints.timings if profiled else {},
+                peak_memory if profiled else None,
+                ddbClient
+            )
     except Exception as err:
         logger.error(f"Error while executing step: {str(err)}")
         ddbClient.updateExecItemStatus(exec_id, 'FAILED', logger.get_logs())
 
         raise err # throw it
+
+# :: run the feature engineering step for several executions in one job
+# the asset CSVs are loaded once and every feature block is computed once per distinct settings and row set.
+# Offline only: the pipeline's training step reads a single train/test output, the datasets of a batch are
+# consumed from the models bucket (<executionId>/data/...)
+def run_batch(exec_ids, resume=False, force=False):
+    if not exec_ids:
+        raise Exception('exec_ids parameter not set. Quitting...')
+
+    prepare_tmp_dirs()
+    ddbClient = DDBClient()
+    s3Client = S3Client()
+
+    assets = ddbClient.listAssets()
+    templates = {}
+    for exec_id in exec_ids:
+        execution_instance = ddbClient.getTrainingExecutionItem(exec_id)
+        templates[exec_id] = ddbClient.getTrainingTemplate(execution_instance['templateId'])
+
+    # :: load the union of all assets needed by the templates once
+    tickers = set()
+    for template in templates.values():
+        tickers.update(data_helper.get_assets_to_load(template, assets))
+    tickers = [t for t in sorted(tickers) if os.path.exists(f"{config.ASSETS_DIR}/{t}.csv")]
+
+    frames = { t: read_asset_csv(t) for t in tickers }
+    digests = { t: file_digest(f"{config.ASSETS_DIR}/{t}.csv") for t in tickers }
+    logger.info(f"Batch of {len(exec_ids)} executions, {len(frames)} asset CSVs loaded once")
+
+    shared = {
+        'ddbClient': ddbClient,
+        's3Client': s3Client,
+        'assets': assets,
+        'templates': templates,
+        'frames': frames,
+        'digests': digests,
+        'features': {},
+        # separate output folders so the executions of the batch don't overwrite each other
+        'outputsPerExecution': True,
+    }
+
+    failed = []
+    for exec_id in exec_ids:
+        try:
+            run_step(exec_id, resume=resume, shared=shared, force=force)
+        except Exception as err:
+            # run_step has already marked the execution item FAILED
+            logger.error(f"Execution {exec_id} of the batch failed: {str(err)}")
+            failed.append(exec_id)
+
+    if failed:
+        raise Exception(f"{len(failed)} of {len(exec_ids)} executions failed: {failed}")
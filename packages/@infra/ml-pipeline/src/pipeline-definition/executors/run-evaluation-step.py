@@ -0,0 +1,34 @@
+import argparse
+import os
+import shutil
+import logging
+
+logger = logging.getLogger('executor')
+logger.setLevel(logging.INFO)
+
+# get the parameters passed as "job_arguments"
+parser = argparse.ArgumentParser()
+parser.add_argument("--executionid", type=str, required=True)
+parser.add_argument("--quantiles", type=str, nargs="+", help="quantiles of the batch transform output to evaluate")
+args = parser.parse_args()
+
+logger.info("job_arguments: %s", args)
+
+# code dir mapped to container
+CODE_DIR='/opt/ml/processing/input/code'
+
+# make the original code accessible to this executor
+shutil.copy('/app/step_evaluation.py', os.path.join(CODE_DIR, 'step_evaluation.py'))
+shutil.copytree('/app/lib', os.path.join(CODE_DIR, 'lib'))
+
+logger.info("Original files copied to %s", CODE_DIR)
+logger.info("Contents of %s: %s", CODE_DIR, os.listdir(CODE_DIR))
+
+# import the evaluation step
+import step_evaluation
+
+# run step
+if args.quantiles:
+    step_evaluation.run_step(args.executionid, quantiles=args.quantiles)
+else:
+    step_evaluation.run_step(args.executionid)
@@ -6,29 +6,40 @@ import logging
 logger = logging.getLogger('executor')
 logger.setLevel(logging.INFO)
 
-# get the parameters passed as "job_arguments"
-parser = argparse.ArgumentParser()
-parser.add_argument("--executionid", type=str, required=True)
-args = parser.parse_args()
-
-# exec_id represents the model training instance in DDB
-exec_id = args.executionid
-
-logger.info("job_arguments: %s", args)
-logger.info("exec_id=%s", exec_id)
-
-# code dir mapped to container
-CODE_DIR='/opt/ml/processing/input/code'
-
-# make the original code accessible to this executor
-shutil.copy('/app/step_feature_engineering.py', os.path.join(CODE_DIR, 'step_feature_engineering.py'))
-shutil.copytree('/app/lib', os.path.join(CODE_DIR, 'lib'))
-
-logger.info("Original files copied to %s", CODE_DIR)
-logger.info("Contents of %s: %s", CODE_DIR, os.listdir(CODE_DIR))
-
-# import 1st step
-import step_feature_engineering
-
-# run step
-step_feature_engineering.run_step(exec_id)
+# the ARIMA process pool starts its workers from a fork server, which runs this file again as __mp_main__
+if __name__ == '__main__':
+    # get the parameters passed as "job_arguments"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--executionid", type=str, nargs="+", required=True)
+    parser.add_argument("--resume", action="store_true", help="skip stages restored from matching checkpoints")
+    parser.add_argument("--force", action="store_true", help="recompute even if a finished execution has the same inputs")
+    args = parser.parse_args()
+
+    # exec_id represents the model training instance in DDB, several ids run in batch mode (offline only, the
+    # pipeline passes a single id and its training step reads a single train/test output)
+    exec_ids = args.executionid
+
+    logger.info("job_arguments: %s", args)
+    logger.info("exec_ids=%s", exec_ids)
+
+    # code dir mapped to container
+    CODE_DIR='/opt/ml/processing/input/code'
+
+    # make the original code accessible to this executor
+    shutil.copy('/app/step_feature_engineering.py', os.path.join(CODE_DIR, 'step_feature_engineering.py'))
+    shutil.copytree('/app/lib', os.path.join(CODE_DIR, 'lib'))
+
+    logger.info("Original files copied to %s", CODE_DIR)
+    logger.info("Contents of %s: %s", CODE_DIR, os.listdir(CODE_DIR))
+
+    # import 1st step
+    import step_feature_engineering
+
+    resume = args.resume or step_feature_engineering.config.resumeFromCheckpoint
+    force = args.force or step_feature_engineering.config.forceRecompute
+
+    # run step
+    if len(exec_ids) == 1:
+        step_feature_engineering.run_step(exec_ids[0], resume=resume, force=force)
+    else:
+        step_feature_engineering.run_batch(exec_ids, resume=resume, force=force)
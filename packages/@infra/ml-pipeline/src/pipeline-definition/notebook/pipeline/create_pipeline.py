@@ -1,20 +1,26 @@
 import os
+import json
 import xgboost as xgb
 import boto3
 import sagemaker
 import sagemaker.session
 from sagemaker.estimator import Estimator
-from sagemaker.inputs import TrainingInput, CreateModelInput
+from sagemaker.inputs import TrainingInput, CreateModelInput, TransformInput
 from sagemaker.model import Model
 from sagemaker.model_metrics import MetricsSource, ModelMetrics
 from sagemaker.processing import ProcessingInput, ProcessingOutput, ScriptProcessor
 from sagemaker.workflow.condition_step import ConditionStep, JsonGet
-from sagemaker.workflow.conditions import ConditionGreaterThanOrEqualTo
+from sagemaker.transformer import Transformer
+from sagemaker.workflow.conditions import ConditionGreaterThanOrEqualTo, ConditionLessThanOrEqualTo
+from sagemaker.workflow.functions import Join
 from sagemaker.workflow.parameters import ParameterInteger, ParameterString, ParameterFloat
 from sagemaker.workflow.pipeline import Pipeline
 from sagemaker.workflow.properties import PropertyFile
 from sagemaker.workflow.step_collections import RegisterModel
-from sagemaker.workflow.steps import ProcessingStep, TrainingStep, CreateModelStep
+from sagemaker.workflow.steps import ProcessingStep, TrainingStep, CreateModelStep, TransformStep
+
+# quantiles of the batch transform forecasts scored by the evaluation step
+EVALUATION_QUANTILES = ["0.1", "0.5", "0.9"]
 
 
 def get_sagemaker_session(region, default_bucket):
@@ -78,6 +84,9 @@ def create_pipeline(
     processing_instance_type = ParameterString(
         name="ProcessingInstanceType", default_value="ml.m5.xlarge"
     )
+    processing_volume_size = ParameterInteger(
+        name="ProcessingVolumeSizeInGB", default_value=30
+    )
     training_instance_type = ParameterString(
         name="TrainingInstanceType", default_value="ml.m5.xlarge"
     )
@@ -94,6 +103,9 @@ def create_pipeline(
     input_hyperparam_prediction_length = ParameterString(name="HyperParamPredictionLength")
     input_model_package_group_name = ParameterString("ModelPackageGroupName")
 
+    # models with a larger mean weighted quantile loss on the test windows are not registered
+    input_max_mean_quantile_loss = ParameterFloat(name="MaxMeanQuantileLoss", default_value=1.0)
+
     input_model_approval_status = ParameterString(
         name="ModelApprovalStatus",
         default_value="Approved", # ModelApprovalStatus can be set to a default of "Approved" if you don't want manual approval.
@@ -109,7 +121,7 @@ def create_pipeline(
         instance_count=processing_instance_count,
         base_job_name=f"{base_job_prefix}/feature-engineering",
         sagemaker_session=sagemaker_session,
-        volume_size_in_gb=30,
+        volume_size_in_gb=processing_volume_size,
         env=container_env,
         command=["python3"]
     )
@@ -126,6 +138,7 @@ def create_pipeline(
             ProcessingOutput(output_name="train", source="/opt/ml/processing/train"),
             ProcessingOutput(output_name="test", source="/opt/ml/processing/test"),
             ProcessingOutput(output_name="features", source="/opt/ml/processing/features"),
+            ProcessingOutput(output_name="evaluation", source="/opt/ml/processing/evaluation"),
         ],
     )
     
@@ -192,6 +205,88 @@ def create_pipeline(
         inputs=createmodel_inputs
     )
 
+    ########################
+    # BATCH TRANSFORM STEP #
+    ########################
+    # forecasts of the test windows: the evaluation input is test.json without the last prediction_length values
+    transformer = Transformer(
+        model_name=step_createmodel.properties.ModelName,
+        instance_type="ml.m5.xlarge",
+        instance_count=1,
+        output_path=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/transform",
+        accept="application/jsonlines",
+        assemble_with="Line",
+        env={
+            "DEEPAR_INFERENCE_CONFIG": json.dumps({
+                "num_samples": 100,
+                "output_types": ["mean", "quantiles"],
+                "quantiles": EVALUATION_QUANTILES,
+            }),
+        },
+        sagemaker_session=sagemaker_session,
+    )
+
+    step_transform = TransformStep(
+        name="AssetPrediction-Transform-Step",
+        transformer=transformer,
+        inputs=TransformInput(
+            data=step_feature_engineering.properties.ProcessingOutputConfig.Outputs["evaluation"].S3Output.S3Uri,
+            content_type="application/jsonlines",
+            split_type="Line",
+        ),
+    )
+
+    ###################
+    # EVALUATION STEP #
+    ###################
+    evaluation_processor = sagemaker.processing.ScriptProcessor(
+        role=role,
+        image_uri=processing_image_uri,
+        instance_type="ml.m5.xlarge",
+        instance_count=1,
+        base_job_name=f"{base_job_prefix}/evaluation",
+        sagemaker_session=sagemaker_session,
+        env=container_env,
+        command=["python3"]
+    )
+
+    evaluation_report = PropertyFile(
+        name="EvaluationReport",
+        output_name="evaluation",
+        path="evaluation.json",
+    )
+
+    step_evaluation = ProcessingStep(
+        name="AssetPrediction-Evaluation-Step",
+        processor=evaluation_processor,
+        code=f"s3://{pipeline_bucket_name}/code/executor/run-evaluation-step.py",
+        job_arguments=["--executionid", input_execution_id, "--quantiles", *EVALUATION_QUANTILES],
+        inputs=[
+            ProcessingInput(
+                source=step_feature_engineering.properties.ProcessingOutputConfig.Outputs["test"].S3Output.S3Uri,
+                destination="/opt/ml/processing/input/test",
+            ),
+            ProcessingInput(
+                source=step_transform.properties.TransformOutput.S3OutputPath,
+                destination="/opt/ml/processing/input/predictions",
+            ),
+        ],
+        outputs=[
+            ProcessingOutput(output_name="evaluation", source="/opt/ml/processing/evaluation"),
+        ],
+        property_files=[evaluation_report],
+    )
+
+    model_metrics = ModelMetrics(
+        model_statistics=MetricsSource(
+            s3_uri=Join(on="/", values=[
+                step_evaluation.properties.ProcessingOutputConfig.Outputs["evaluation"].S3Output.S3Uri,
+                "evaluation.json",
+            ]),
+            content_type="application/json",
+        )
+    )
+
     #######################
     # REGISTER MODEL STEP #
     #######################
@@ -206,7 +301,25 @@ def create_pipeline(
         inference_instances=["ml.t2.medium"],
         transform_instances=["ml.m5.large"],
         model_package_group_name=input_model_package_group_name,
-        approval_status=input_model_approval_status
+        approval_status=input_model_approval_status,
+        model_metrics=model_metrics,
+    )
+
+    # register the model only if its forecasts are good enough
+    step_condition = ConditionStep(
+        name="AssetPrediction-Evaluation-Condition",
+        conditions=[
+            ConditionLessThanOrEqualTo(
+                left=JsonGet(
+                    step_name=step_evaluation.name,
+                    property_file=evaluation_report,
+                    json_path="regression_metrics.mean_wQuantileLoss.value",
+                ),
+                right=input_max_mean_quantile_loss,
+            )
+        ],
+        if_steps=[step_register],
+        else_steps=[],
     )
 
     # Pipeline instance
@@ -215,6 +328,7 @@ def create_pipeline(
         parameters=[
             processing_instance_type,
             processing_instance_count,
+            processing_volume_size,
             training_instance_type,
             input_execution_id,
             input_assets_data,
@@ -225,14 +339,17 @@ def create_pipeline(
             input_hyperparam_learning_rate,
             input_hyperparam_context_length,
             input_hyperparam_prediction_length,
+            input_max_mean_quantile_loss,
             input_model_approval_status,
             input_model_package_group_name,
         ],
         steps=[
             step_feature_engineering,
             step_train,
-            step_register,
             step_createmodel,
+            step_transform,
+            step_evaluation,
+            step_condition,
         ],
         sagemaker_session=sagemaker_session,
     )